@@ -0,0 +1,97 @@
+import math
+import random
+import statistics
+import time
+
+from sqlalchemy import func
+
+from seed import bench_app, seed
+from models import db, Question
+from flaskr.quiz import QuizDecks, QuizSession, requested_difficulty
+
+BANK_SIZE = 100000
+QUIZZES = 10000
+SQL_QUIZZES = 500
+TURNS = 10
+
+
+def answers_correctly(rng, skill, difficulty):
+    # a player answers a question at their own level half of the time
+    chance = 1 / (1 + math.exp(4 * ((difficulty - 1) / 4 - skill)))
+    return rng.random() < chance
+
+
+def deck_turn(decks, session, seen_ids, difficulty):
+    question_id = decks.draw(session.category_id, session.seen, difficulty)
+    if question_id is None:
+        return None
+    return db.session.get(Question, question_id)
+
+
+def sql_turn(decks, session, seen_ids, difficulty):
+    # served by ix_questions_category_difficulty
+    return Question.query.filter(
+        Question.category == session.category_id,
+        Question.difficulty == difficulty,
+        ~Question.id.in_(seen_ids)
+        ).order_by(func.random()).limit(1).one_or_none()
+
+
+def simulate(turn, decks, quizzes):
+    rng = random.Random(42)
+    samples = []
+    final = {}
+    for _ in range(quizzes):
+        skill = rng.random()
+        session = QuizSession(rng.randint(1, 6), 0, adaptive=True)
+        seen_ids = []
+        difficulty = None
+        for _ in range(TURNS):
+            difficulty = requested_difficulty({}, session)
+            start = time.perf_counter()
+            question = turn(decks, session, seen_ids, difficulty)
+            samples.append((time.perf_counter() - start) * 1000)
+            if question is None:
+                break
+            session.seen.add(question.id)
+            seen_ids.append(question.id)
+            session.record(answers_correctly(rng, skill, question.difficulty))
+        final.setdefault(min(int(skill * 4), 3), []).append(difficulty)
+        db.session.expunge_all()
+
+    samples.sort()
+    return samples, final
+
+
+def main():
+    app, path = bench_app()
+    with app.app_context():
+        seed(BANK_SIZE)
+        decks = QuizDecks()
+        decks.build()
+
+        print(f"{BANK_SIZE} questions, {TURNS} turns per quiz")
+        print(f"{'engine':<8} {'quizzes':>8} {'turns/s':>9} {'p50 ms':>8} "
+              f"{'p99 ms':>8}")
+        finals = {}
+        for name, turn, quizzes in (("decks", deck_turn, QUIZZES),
+                                    ("sql", sql_turn, SQL_QUIZZES)):
+            started = time.perf_counter()
+            samples, finals[name] = simulate(turn, decks, quizzes)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<8} {quizzes:>8} {len(samples) / elapsed:>9.0f} "
+                  f"{statistics.median(samples):>8.3f} "
+                  f"{samples[int(len(samples) * 0.99)]:>8.3f}")
+
+        print("difficulty of the last turn by player skill (decks run):")
+        final = finals["decks"]
+        for quartile in sorted(final):
+            print(f"  skill {quartile / 4:.2f}-{(quartile + 1) / 4:.2f}: "
+                  f"mean {statistics.mean(final[quartile]):.2f}")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import statistics
+import threading
+import time
+
+from sqlalchemy import event
+
+from seed import bench_app, seed
+from models import db
+
+BANK_SIZE = 100000
+CLIENTS = [10, 50, 100]
+ROUNDS = 10
+ROUTES = ["/categories/1/questions?page=1", "/categories"]
+
+
+def burst(app, clients):
+    # every client sends the same request at the same moment, like a
+    # quiz launch
+    barrier = threading.Barrier(clients)
+    latencies = []
+    lock = threading.Lock()
+
+    def run():
+        client = app.test_client()
+        samples = []
+        for round_number in range(ROUNDS):
+            barrier.wait()
+            start = time.perf_counter()
+            client.get(ROUTES[round_number % len(ROUTES)])
+            samples.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=run) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return latencies
+
+
+def main():
+    app, path = bench_app()
+    statements = [0]
+    with app.app_context():
+        seed(BANK_SIZE)
+
+        @event.listens_for(db.engine, "after_cursor_execute")
+        def count(conn, cursor, statement, parameters, context,
+                  executemany):
+            statements[0] += 1
+
+    print(f"{BANK_SIZE} questions, {ROUNDS} bursts per run")
+    print(f"{'single flight':<14} {'clients':>7} {'statements':>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for single_flight in (False, True):
+        app.config["SINGLE_FLIGHT"] = single_flight
+        for clients in CLIENTS:
+            statements[0] = 0
+            latencies = burst(app, clients)
+            print(f"{'on' if single_flight else 'off':<14} {clients:>7} "
+                  f"{statements[0]:>10} "
+                  f"{statistics.median(latencies):>8.2f} "
+                  f"{latencies[int(len(latencies) * 0.99)]:>8.2f}")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
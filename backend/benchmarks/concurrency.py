@@ -0,0 +1,101 @@
+import asyncio
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+from seed import bench_app, seed
+from flaskr.asgi import create_asgi_app
+from models import db
+
+BANK_SIZE = 10000
+PLAYER_COUNTS = [1, 10, 50, 100]
+TURNS = 20
+
+
+def summary(name, players, latencies, elapsed):
+    latencies.sort()
+    print(f"{name:<6} {players:>7} {len(latencies) / elapsed:>10.0f} "
+          f"{statistics.median(latencies):>8.2f} "
+          f"{latencies[int(len(latencies) * 0.99)]:>8.2f}")
+
+
+def flask_players(app, players):
+    # one thread per player, like a threaded WSGI server
+    latencies = []
+    lock = threading.Lock()
+
+    def play():
+        client = app.test_client()
+        token = client.post("/quizzes/sessions", json={
+            "quiz_category": {"id": 0}}).get_json()["session"]
+        samples = []
+        for _ in range(TURNS):
+            start = time.perf_counter()
+            client.post("/quizzes", json={"session": token})
+            samples.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=play) for _ in range(players)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, time.perf_counter() - start
+
+
+async def asgi_players(app, players):
+    # every player is a task on a single event loop
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+
+    async def play(client):
+        response = await client.post("/quizzes/sessions", json={
+            "quiz_category": {"id": 0}})
+        token = response.json()["session"]
+        for _ in range(TURNS):
+            start = time.perf_counter()
+            await client.post("/quizzes", json={"session": token})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    # the transport doesn't send lifespan events; run them here so the
+    # pool is bound to this event loop and disposed with it
+    await app.router.startup()
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[play(client) for _ in range(players)])
+        elapsed = time.perf_counter() - start
+    await app.router.shutdown()
+
+    return latencies, elapsed
+
+
+def main():
+    app, path = bench_app()
+    with app.app_context():
+        seed(BANK_SIZE)
+    asgi_app = create_asgi_app({
+        "SQLALCHEMY_DATABASE_URI": app.config["SQLALCHEMY_DATABASE_URI"]
+        })
+
+    print(f"{BANK_SIZE} questions, {TURNS} quiz turns per player")
+    print(f"{'app':<6} {'players':>7} {'req/s':>10} {'p50 ms':>8} "
+          f"{'p99 ms':>8}")
+    for players in PLAYER_COUNTS:
+        summary("flask", players, *flask_players(app, players))
+        summary("asgi", players, *asyncio.run(asgi_players(asgi_app,
+                                                           players)))
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
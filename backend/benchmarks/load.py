@@ -0,0 +1,318 @@
+import argparse
+import http.client
+import itertools
+import json
+import platform
+import random
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from seed import WORDS, bench_app, seed
+from models import db
+
+SIZES = [1000, 100000, 1000000]
+CATEGORY_COUNT = 6
+THREADS = 8
+REQUESTS = 200
+TRANSPORTS = ["client", "http"]
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+
+
+"""
+Workload
+    builds one request per call for every route in create_app: a
+    (method, path, json body) tuple. Creates use a fresh question text
+    and deletes a question id nobody has deleted yet, so concurrent
+    threads never collide on either.
+"""
+
+
+class Workload:
+
+    def __init__(self, size, categories, seed=42):
+        self.size = size
+        self.categories = categories
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._created = itertools.count(1)
+        self._deleted = itertools.count(1)
+
+    def _pick(self, call, *args):
+        with self._lock:
+            return call(*args)
+
+    def _next(self, counter):
+        with self._lock:
+            return next(counter)
+
+    def routes(self):
+        pages = max(self.size // 10, 1)
+
+        yield "GET /categories", True, lambda: ("GET", "/categories", None)
+        yield "GET /questions", True, lambda: (
+            "GET",
+            f"/questions?page={self._pick(self._rng.randint, 1, pages)}",
+            None)
+        yield "GET /categories/<id>/questions", True, lambda: (
+            "GET", f"/categories/"
+            f"{self._pick(self._rng.randint, 1, self.categories)}/questions",
+            None)
+        yield "POST /questions search", True, lambda: (
+            "POST", "/questions",
+            {"searchTerm": self._pick(self._rng.choice, WORDS)})
+        yield "POST /quizzes", True, lambda: (
+            "POST", "/quizzes",
+            {"previous_questions": self._pick(self._rng.sample,
+                                              range(1, self.size + 1), 5),
+             "quiz_category": {
+                 "id": self._pick(self._rng.randint, 0, self.categories)}})
+        yield "POST /questions create", False, lambda: (
+            "POST", "/questions",
+            {"question": f"Load test question {self._next(self._created)}?",
+             "answer": "Yes", "difficulty": 1, "category": 1})
+        yield "DELETE /questions/<id>", False, lambda: (
+            "DELETE", f"/questions/{self._next(self._deleted)}", None)
+
+
+class ClientTransport:
+
+    name = "client"
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.open(path, method=method, json=body).status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+"""
+HttpTransport
+    serves the app from a threaded werkzeug server on a free local port
+    and sends real HTTP requests, one connection per load thread, so
+    socket, header parsing and WSGI overhead are part of the timing
+"""
+
+
+class HttpTransport:
+
+    name = "http"
+
+    def __init__(self, app):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True,
+                                  request_handler=QuietRequestHandler)
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                "127.0.0.1", self.server.server_port)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        connection.request(method, path, payload, headers)
+        response = connection.getresponse()
+        response.read()
+        if response.will_close:
+            connection.close()
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+        self._thread.join()
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def drive(transport, make_request, threads, requests):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(requests // threads, 1)
+
+    def run():
+        samples = []
+        failed = 0
+        for _ in range(per_thread):
+            method, path, body = make_request()
+            start = time.perf_counter()
+            try:
+                status = transport.send(method, path, body)
+            except (OSError, http.client.HTTPException):
+                status = None
+            samples.append((time.perf_counter() - start) * 1000)
+            if status is None or status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(samples)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "throughput": round(len(latencies) / elapsed, 1),
+        **{name: round(percentile(latencies, fraction), 3)
+           for name, fraction in PERCENTILES.items()}
+    }
+
+
+def run_size(size, args):
+    app, path = bench_app()
+    # every load thread shares one address; measure the routes, not 429s
+    app.config["RATE_LIMIT"] = False
+    with app.app_context():
+        started = time.perf_counter()
+        seed(size, args.categories)
+        seeded = time.perf_counter() - started
+        dialect = db.engine.dialect.name
+    print(f"seeded {size} questions in {seeded:.1f} s", file=sys.stderr)
+
+    results = []
+    workload = Workload(size, args.categories)
+    for name in args.transports:
+        transport = (ClientTransport if name == "client"
+                     else HttpTransport)(app)
+        for route, warm, make_request in workload.routes():
+            if warm:
+                # the first call fills the category cache and quiz decks
+                transport.send(*make_request())
+            result = drive(transport, make_request, args.threads,
+                           args.requests)
+            results.append({"questions": size, "transport": name,
+                            "route": route, **result})
+            print(f"{size:>8} {name:<7} {route:<32} "
+                  f"{result['throughput']:>9.0f}/s "
+                  f"p50 {result['p50']:>8.2f} p95 {result['p95']:>8.2f} "
+                  f"p99 {result['p99']:>8.2f} errors {result['errors']}",
+                  file=sys.stderr)
+        transport.close()
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+    return dialect, results
+
+
+"""
+regressions(results, baseline, tolerance)
+    lists every route whose p95 grew by more than `tolerance` (a
+    fraction) over the matching entry of an earlier run's JSON
+"""
+
+
+def regressions(results, baseline, tolerance):
+    def key(result):
+        return result["questions"], result["transport"], result["route"]
+
+    previous = {key(result): result for result in baseline["results"]}
+    slower = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is not None and result["p95"] > before["p95"] * (
+                1 + tolerance):
+            slower.append({"questions": result["questions"],
+                           "transport": result["transport"],
+                           "route": result["route"],
+                           "baseline_p95": before["p95"],
+                           "p95": result["p95"]})
+
+    return slower
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Load test every Trivia API route.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma separated question bank sizes")
+    parser.add_argument("--categories", type=int, default=CATEGORY_COUNT)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    parser.add_argument("--requests", type=int, default=REQUESTS,
+                        help="requests per route")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS),
+                        help="client (Flask test client), http or both")
+    parser.add_argument("--output", help="write the JSON report here "
+                                         "instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run "
+                                           "to compare p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.transports = args.transports.split(",")
+    for name in args.transports:
+        if name not in TRANSPORTS:
+            parser.error(f"unknown transport {name!r}")
+
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    dialect = None
+    results = []
+    for size in args.sizes:
+        dialect, size_results = run_size(size, args)
+        results.extend(size_results)
+
+    report = {
+        "database": dialect,
+        "python": platform.python_version(),
+        "categories": args.categories,
+        "threads": args.threads,
+        "requests_per_route": args.requests,
+        "results": results
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = regressions(results, json.load(baseline),
+                                 args.tolerance)
+        report["regressions"] = slower
+        status = 1 if slower else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+from seed import bench_app, seed
+from models import db
+from flaskr.compression import brotli
+
+BANK_SIZE = 1000
+CATEGORY_COUNT = 24
+
+
+def variants(version):
+    slim = f"fields=id,question&compact=1&categories_version={version}"
+
+    yield "full", "/questions", {}
+    yield "fields=id,question", "/questions?fields=id,question", {}
+    yield "compact + known categories", f"/questions?{slim}", {}
+    yield "full, gzip", "/questions", {"Accept-Encoding": "gzip"}
+    yield ("compact + known categories, gzip", f"/questions?{slim}",
+           {"Accept-Encoding": "gzip"})
+    if brotli is not None:
+        yield "full, br", "/questions", {"Accept-Encoding": "br"}
+        yield ("compact + known categories, br", f"/questions?{slim}",
+               {"Accept-Encoding": "br"})
+
+
+def main():
+    app, path = bench_app()
+    app.config["COMPRESS_MIN_SIZE"] = 0
+    with app.app_context():
+        seed(BANK_SIZE, CATEGORY_COUNT)
+
+    client = app.test_client()
+    version = client.get("/questions").get_json()["categories_version"]
+
+    print(f"GET /questions page of 10, {CATEGORY_COUNT} categories")
+    print(f"{'variant':<36} {'bytes':>7} {'vs full':>8}")
+    full = None
+    for name, url, headers in variants(version):
+        size = len(client.get(url, headers=headers).data)
+        full = full or size
+        print(f"{name:<36} {size:>7} {size / full:>8.0%}")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+
+from seed import bench_app, seed
+from models import db
+
+BANK_SIZE = 10000
+WORKER_COUNTS = [1, 2, 4, 8]
+THREADS_PER_WORKER = 4
+REQUESTS_PER_THREAD = 100
+ROUTES = ["/questions", "/categories/1/questions", "/questions?page=20"]
+
+
+def worker(path, results):
+    # each process stands in for one gunicorn worker with its own pool
+    app, _ = bench_app(path)
+    client_latencies = []
+    lock = threading.Lock()
+
+    def run():
+        client = app.test_client()
+        samples = []
+        for i in range(REQUESTS_PER_THREAD):
+            start = time.perf_counter()
+            client.get(ROUTES[i % len(ROUTES)])
+            samples.append((time.perf_counter() - start) * 1000)
+        with lock:
+            client_latencies.extend(samples)
+
+    threads = [threading.Thread(target=run)
+               for _ in range(THREADS_PER_WORKER)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results.put(client_latencies)
+
+
+def sample_connections(app, stop, peaks):
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            return
+        while not stop.is_set():
+            count = db.session.execute(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database()"
+                ).scalar()
+            db.session.commit()
+            peaks.append(count)
+            time.sleep(0.05)
+
+
+def main():
+    app, path = bench_app()
+    with app.app_context():
+        seed(BANK_SIZE)
+
+    print(f"pool: size={os.environ.get('DB_POOL_SIZE', 5)} "
+          f"overflow={os.environ.get('DB_MAX_OVERFLOW', 10)} "
+          f"pgbouncer={os.environ.get('DB_PGBOUNCER', '0')}")
+    print(f"{'workers':>7} {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'max connections':>16}")
+
+    for workers in WORKER_COUNTS:
+        results = multiprocessing.Queue()
+        stop = threading.Event()
+        peaks = []
+        sampler = threading.Thread(target=sample_connections,
+                                   args=(app, stop, peaks))
+        sampler.start()
+
+        processes = [multiprocessing.Process(target=worker,
+                                             args=(path, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        latencies = []
+        for _ in processes:
+            latencies.extend(results.get())
+        for process in processes:
+            process.join()
+
+        stop.set()
+        sampler.join()
+
+        latencies.sort()
+        connections = max(peaks) if peaks else "n/a"
+        print(f"{workers:>7} {len(latencies):>8} "
+              f"{statistics.median(latencies):>8.2f} "
+              f"{latencies[int(len(latencies) * 0.99)]:>8.2f} "
+              f"{connections:>16}")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+
+from seed import bench_app, seed
+from models import db, Question
+from flaskr.quiz import QuizDecks
+
+BANK_SIZES = [1000, 10000, 100000]
+TURNS = 100
+
+
+def legacy_turn(category_id, previous_questions):
+    questions = Question.query.filter(
+        ~Question.id.in_(previous_questions),
+        Question.category == category_id
+        ).order_by(Question.id).all()
+
+    current_questions = [question.format() for question in questions[:10]]
+    return random.choice(current_questions) if current_questions else None
+
+
+def deck_turn(decks, category_id, previous_questions):
+    question_id = decks.draw(category_id, set(previous_questions))
+    if question_id is None:
+        return None
+    return Question.query.get(question_id).format()
+
+
+def measure(turn, *args):
+    samples = []
+    previous_questions = []
+    for _ in range(TURNS):
+        start = time.perf_counter()
+        question = turn(*args, previous_questions)
+        samples.append((time.perf_counter() - start) * 1000)
+        if question is None:
+            break
+        previous_questions.append(question["id"])
+        db.session.expunge_all()
+
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+def main():
+    print(f"{'questions':>10} {'legacy p50':>11} {'legacy p99':>11} "
+          f"{'deck p50':>10} {'deck p99':>10}  (ms per turn)")
+
+    for size in BANK_SIZES:
+        app, path = bench_app()
+        with app.app_context():
+            seed(size)
+
+            decks = QuizDecks()
+            decks.build()
+
+            legacy = measure(legacy_turn, 1)
+            dealt = measure(lambda *args: deck_turn(decks, *args), 1)
+
+            db.session.remove()
+            db.drop_all()
+
+        print(f"{size:>10} {legacy[0]:>11.3f} {legacy[1]:>11.3f} "
+              f"{dealt[0]:>10.3f} {dealt[1]:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import datetime
+import random
+import statistics
+import time
+
+from sqlalchemy import case, func
+
+from seed import bench_app, seed
+from models import db, QuizAnswer
+from flaskr.results import ResultRecorder
+
+ANSWERS = 20000
+PLAYERS = 2000
+READS = 200
+
+
+def answers(n):
+    rng = random.Random(7)
+    for _ in range(n):
+        yield (f"player {rng.randint(1, PLAYERS)}", rng.randint(1, 1000),
+               rng.random() < 0.6, rng.randint(1, 6))
+
+
+def commit_per_answer(n):
+    for player, question_id, correct, category_id in answers(n):
+        db.session.add(QuizAnswer(
+            player=player, question=question_id, correct=correct,
+            category=category_id, answered_at=datetime.datetime.utcnow()))
+        db.session.commit()
+
+
+def group_by_leaders(category_id):
+    score = func.sum(case((QuizAnswer.correct, 1), else_=0))
+    return db.session.query(QuizAnswer.player, score).filter(
+        QuizAnswer.category == category_id
+        ).group_by(QuizAnswer.player).order_by(
+            score.desc(), QuizAnswer.player).limit(10).all()
+
+
+def timed(call, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    app, path = bench_app()
+    app.config["RESULTS_FLUSH_INTERVAL"] = 0.2
+    with app.app_context():
+        seed(1000)
+
+        per_answer = timed(lambda: commit_per_answer(ANSWERS // 10))[0]
+        db.session.query(QuizAnswer).delete()
+        db.session.commit()
+
+        recorder = ResultRecorder(app)
+
+        def record_all():
+            for answer in answers(ANSWERS):
+                recorder.record(*answer)
+            recorder.close()
+
+        batched = timed(record_all)[0]
+        stats = recorder.stats()
+
+        group_by = timed(lambda: group_by_leaders(1), READS)
+        incremental = timed(lambda: recorder.leaders(1), READS)
+
+        print(f"{'writes':<28} {'answers':>8} {'answers/s':>10}")
+        print(f"{'commit per answer':<28} {ANSWERS // 10:>8} "
+              f"{ANSWERS // 10 / per_answer * 1000:>10.0f}")
+        print(f"{'buffered batches':<28} {ANSWERS:>8} "
+              f"{ANSWERS / batched * 1000:>10.0f}   "
+              f"({stats['batches']} batches, {stats['pending']} pending)")
+        print(f"{'top 10 read':<28} {'p50 ms':>8} {'p99 ms':>10}")
+        for name, samples in (("GROUP BY per read", group_by),
+                              ("incremental leaderboard", incremental)):
+            samples.sort()
+            print(f"{name:<28} {statistics.median(samples):>8.3f} "
+                  f"{samples[int(len(samples) * 0.99)]:>10.3f}")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
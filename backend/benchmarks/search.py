@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from flask import request
+
+from seed import bench_app, seed
+from models import db, Question
+from flaskr.search import QuestionSearch
+
+BANK_SIZE = 100000
+TERMS = ["lake", "famous painter", "vol", "ancient empire war",
+         "championship medal", "satellite rocket engine"]
+REPEAT = 20
+
+SEARCH_VECTOR_DDL = (
+    "ALTER TABLE questions ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS "
+    "(to_tsvector('english', coalesce(question, ''))) STORED; "
+    "CREATE INDEX ix_questions_search_vector ON questions "
+    "USING gin (search_vector)"
+)
+
+
+def ilike_search(term):
+    selection = Question.query.filter(
+        Question.question.ilike(f'%{term}%')
+        ).order_by(Question.id).all()
+    return [question.format() for question in selection[:10]], len(selection)
+
+
+def indexed_search(search, term):
+    selection, total = search.search(request, term)
+    return [question.format() for question in selection], total
+
+
+def measure(fn, term):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(term)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.expunge_all()
+
+    samples.sort()
+    return statistics.median(samples), samples[-1]
+
+
+def main():
+    app, path = bench_app()
+    with app.test_request_context("/questions"):
+        seed(BANK_SIZE)
+
+        search = QuestionSearch()
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(SEARCH_VECTOR_DDL)
+            db.session.commit()
+            mode = "tsvector + GIN"
+        else:
+            start = time.perf_counter()
+            search.index.build()
+            mode = "inverted index (built in %.0f ms)" % (
+                (time.perf_counter() - start) * 1000)
+
+        print(f"{BANK_SIZE} questions, indexed search uses {mode}")
+        print(f"{'term':<28} {'ilike p50':>10} {'index p50':>10} "
+              f"{'ilike max':>10} {'index max':>10}  (ms)")
+        for term in TERMS:
+            ilike = measure(ilike_search, term)
+            indexed = measure(lambda t: indexed_search(search, t), term)
+            print(f"{term:<28} {ilike[0]:>10.2f} {indexed[0]:>10.2f} "
+                  f"{ilike[1]:>10.2f} {indexed[1]:>10.2f}")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
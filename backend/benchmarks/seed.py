@@ -0,0 +1,94 @@
+import atexit
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app  # noqa: E402
+from models import db, fingerprint, Question, Category  # noqa: E402
+
+CATEGORY_TYPES = ["Science", "Art", "Geography",
+                  "History", "Entertainment", "Sports"]
+WORDS = ("which what who where when largest smallest first famous ancient "
+         "river lake mountain city country painter novel film actor team "
+         "player record element planet organ invented discovered built "
+         "capital island ocean desert empire war treaty composer opera "
+         "museum palace bridge tower language currency festival dynasty "
+         "volcano glacier forest species mineral engine rocket satellite "
+         "championship tournament medal goal stadium coach league").split()
+
+
+def remove_database(path):
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+"""
+bench_app(path=None)
+    creates the app bound to a throwaway SQLite file so benchmarks
+    never touch the trivia database; the file is removed when the
+    benchmark exits. BENCH_DATABASE_URL points it at a scratch Postgres
+    database instead
+"""
+
+
+def bench_app(path=None):
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if url:
+        path = None
+    else:
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix=".db",
+                                            prefix="trivia-bench-")
+            os.close(handle)
+            os.remove(path)
+            atexit.register(remove_database, path)
+        url = f"sqlite:///{path}"
+
+    # one process takes every write, so its ETags can be trusted
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url,
+                      "DB_CREATE_ALL": True,
+                      "CONDITIONAL_GET": True})
+    return app, path
+
+
+"""
+seed(n_questions, n_categories)
+    fills the bound database with synthetic categories and questions
+    using executemany batches
+"""
+
+
+def seed(n_questions, n_categories=len(CATEGORY_TYPES), batch_size=10000):
+    categories = []
+    for i in range(n_categories):
+        category_type = CATEGORY_TYPES[i % len(CATEGORY_TYPES)]
+        if i >= len(CATEGORY_TYPES):
+            category_type += f" {i + 1}"
+        categories.append({"id": i + 1,
+                           "type": category_type,
+                           "fingerprint": fingerprint(category_type)})
+    db.session.execute(Category.__table__.insert(), categories)
+
+    rng = random.Random(1234)
+    batch = []
+    for i in range(1, n_questions + 1):
+        text = " ".join(rng.sample(WORDS, 7)) + f" {i}?"
+        batch.append({
+            "id": i,
+            "question": text,
+            "fingerprint": fingerprint(text),
+            "answer": f"Answer {i}",
+            "category": rng.randint(1, n_categories),
+            "difficulty": rng.randint(1, 5)
+        })
+        if len(batch) == batch_size:
+            db.session.execute(Question.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Question.__table__.insert(), batch)
+
+    db.session.commit()
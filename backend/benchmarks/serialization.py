@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import joinedload
+
+from seed import bench_app, seed
+from models import db, Question
+from flaskr.serialization import (
+    OrjsonProvider,
+    format_question_row,
+    orjson,
+    question_rows)
+
+ROW_COUNTS = [10, 100, 1000]
+REPEAT = 200
+
+
+def orm_path(n):
+    questions = Question.query.options(
+        joinedload(Question.category_ref)
+        ).order_by(Question.id).limit(n).all()
+    return jsonify({"questions": [question.format()
+                                  for question in questions]})
+
+
+def tuple_path(n):
+    rows = question_rows().order_by(Question.id).limit(n).all()
+    return jsonify({"questions": [format_question_row(row) for row in rows]})
+
+
+def measure(app, provider, path, n):
+    app.json = provider
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        path(n)
+        samples.append((time.perf_counter() - start) * 1000)
+        # a fresh session per request, like the real app
+        db.session.remove()
+
+    return statistics.median(samples)
+
+
+def main():
+    app, path = bench_app()
+    with app.test_request_context("/questions"):
+        seed(max(ROW_COUNTS))
+
+        variants = [
+            ("ORM + format() + stdlib", DefaultJSONProvider(app), orm_path),
+            ("tuples + stdlib", DefaultJSONProvider(app), tuple_path),
+        ]
+        if orjson is not None:
+            variants.append(("tuples + orjson", OrjsonProvider(app),
+                             tuple_path))
+
+        print(f"median ms per response over {REPEAT} runs")
+        print(f"{'path':<28}" + "".join(f"{n:>10}" for n in ROW_COUNTS))
+        for name, provider, fn in variants:
+            timings = [measure(app, provider, fn, n) for n in ROW_COUNTS]
+            print(f"{name:<28}" + "".join(f"{t:>10.3f}" for t in timings))
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import sys
+import threading
+
+from sqlalchemy import event
+
+from seed import bench_app, seed
+from models import db
+
+BANK_SIZE = 10000
+
+# endpoint -> (max statements, max rows fetched); rows must not grow with
+# the size of the question bank
+BUDGETS = {
+    "GET /categories": (1, 6),
+    "GET /questions": (2, 16),
+    "GET /questions?page=500": (2, 16),
+    "GET /questions?after_id=5000": (2, 16),
+    "GET /questions If-None-Match": (0, 0),
+    "GET /categories/1/questions": (3, 12),
+    "POST /questions search": (2, 12),
+    "POST /questions create": (3, 2),
+    "DELETE /questions/<id>": (1, 0),
+    "DELETE /questions?ids= (10 ids)": (1, 0),
+    "POST /categories": (2, 0),
+    "POST /quizzes": (2, 2),
+}
+
+
+class StatementCounter:
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.rows = 0
+        # background deck refills run on their own thread and are not
+        # part of the request being measured
+        self.thread_id = threading.get_ident()
+        event.listen(engine, "after_cursor_execute", self.after_execute)
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        if threading.get_ident() != self.thread_id:
+            return
+
+        self.statements += 1
+        if statement.lstrip().upper().startswith("SELECT"):
+            # re-count the result on a side cursor so the measured
+            # statement's own cursor is left untouched
+            counter = conn.connection.cursor()
+            counter.execute(f"SELECT COUNT(*) FROM ({statement}) AS counted",
+                            parameters)
+            self.rows += counter.fetchone()[0]
+            counter.close()
+
+    def reset(self):
+        self.statements = 0
+        self.rows = 0
+
+
+def requests(client):
+    client.get("/categories")
+
+    yield "GET /categories", lambda: client.get("/categories")
+    yield "GET /questions", lambda: client.get("/questions")
+    yield ("GET /questions?page=500",
+           lambda: client.get("/questions?page=500"))
+    yield ("GET /questions?after_id=5000",
+           lambda: client.get("/questions?after_id=5000"))
+    etag = client.get("/questions").headers["ETag"]
+    yield ("GET /questions If-None-Match",
+           lambda: client.get("/questions", headers={"If-None-Match": etag}))
+    yield ("GET /categories/1/questions",
+           lambda: client.get("/categories/1/questions"))
+    yield ("POST /questions search",
+           lambda: client.post("/questions", json={"searchTerm": "lake"}))
+    yield ("POST /questions create",
+           lambda: client.post("/questions", json={
+               "question": "A brand new benchmark question?",
+               "answer": "Yes", "difficulty": 1, "category": 1}))
+    yield ("DELETE /questions/<id>",
+           lambda: client.delete(f"/questions/{BANK_SIZE // 2}"))
+    yield ("DELETE /questions?ids= (10 ids)",
+           lambda: client.delete("/questions?ids=" + ",".join(
+               str(question_id) for question_id in range(100, 110))))
+    yield ("POST /categories",
+           lambda: client.post("/categories", json={"type": "Benchmarks"}))
+    yield ("POST /quizzes",
+           lambda: client.post("/quizzes", json={
+               "previous_questions": [1, 2, 3],
+               "quiz_category": {"id": 1}}))
+
+
+def main():
+    app, path = bench_app()
+    with app.app_context():
+        seed(BANK_SIZE)
+        counter = StatementCounter(db.engine)
+
+    failures = 0
+    client = app.test_client()
+    print(f"{BANK_SIZE} questions")
+    print(f"{'endpoint':<30} {'status':>6} {'statements':>10} {'rows':>8}")
+    for name, call in requests(client):
+        # search and quiz indexes are (re)built lazily on first use after
+        # a write, measure the steady-state call
+        if name in ("POST /questions search", "POST /quizzes"):
+            call()
+        counter.reset()
+        response = call()
+        max_statements, max_rows = BUDGETS[name]
+        over = (counter.statements > max_statements
+                or counter.rows > max_rows)
+        failures += over
+        print(f"{name:<30} {response.status_code:>6} "
+              f"{counter.statements:>10} {counter.rows:>8}"
+              f"{'  OVER BUDGET' if over else ''}")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import statistics
+import time
+
+from seed import bench_app, seed
+from flaskr import create_app
+from models import db
+
+REPEAT = 30
+
+
+def measure(config):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        app = create_app(config)
+        samples.append((time.perf_counter() - start) * 1000)
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+    samples.sort()
+    return statistics.median(samples), samples[-1]
+
+
+def main():
+    app, path = bench_app()
+    with app.app_context():
+        seed(1000)
+        url = db.engine.url.render_as_string(hide_password=False)
+
+    print(f"create_app() over {REPEAT} runs ({url.split(':')[0]})")
+    print(f"{'mode':<28} {'p50 ms':>8} {'max ms':>8}")
+    for name, config in (
+            ("no DDL (default)", {"SQLALCHEMY_DATABASE_URI": url}),
+            ("DB_CREATE_ALL=1", {"SQLALCHEMY_DATABASE_URI": url,
+                                 "DB_CREATE_ALL": True})):
+        p50, worst = measure(config)
+        print(f"{name:<28} {p50:>8.2f} {worst:>8.2f}")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import itertools
+import random
+import statistics
+import string
+import time
+import tracemalloc
+
+from seed import bench_app, seed
+from models import db
+from flaskr.suggest import PrefixSuggester
+
+BANK_SIZE = 1000000
+VOCABULARY = 500000
+LOOKUPS = 20000
+
+
+def zipf_texts(n, vocabulary, rng):
+    # question texts over a large vocabulary with a long tail, so the
+    # term cap comes into play
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))
+             for _ in range(vocabulary)]
+    cumulative = list(itertools.accumulate(
+        1 / rank for rank in range(1, vocabulary + 1)))
+    for _ in range(n):
+        yield " ".join(rng.choices(words, cum_weights=cumulative,
+                                   k=8)) + "?"
+
+
+def measure(name, suggester, texts, rng):
+    tracemalloc.start()
+    started = time.perf_counter()
+    suggester.build(texts)
+    built = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    prefixes = ["".join(rng.choices(string.ascii_lowercase,
+                                    k=rng.randint(1, 4)))
+                for _ in range(LOOKUPS)]
+    samples = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        suggester.suggest(prefix)
+        samples.append((time.perf_counter() - start) * 1000000)
+    samples.sort()
+
+    stats = suggester.stats()
+    print(f"{name:<22} {stats['terms']:>8} {stats['skipped_terms']:>8} "
+          f"{stats['memory_bytes'] / 1e6:>8.1f} {current / 1e6:>9.1f} "
+          f"{peak / 1e6:>9.1f} {built:>7.1f} "
+          f"{statistics.median(samples):>7.1f} "
+          f"{samples[int(len(samples) * 0.99)]:>7.1f}")
+
+
+def main():
+    rng = random.Random(3)
+    print(f"{BANK_SIZE} questions, {LOOKUPS} lookups of 1-4 letter prefixes")
+    print(f"{'bank':<22} {'terms':>8} {'skipped':>8} {'stats MB':>8} "
+          f"{'traced MB':>9} {'build MB':>9} {'build s':>7} "
+          f"{'p50 us':>7} {'p99 us':>7}")
+
+    app, path = bench_app()
+    with app.app_context():
+        seed(BANK_SIZE)
+        measure("seeded database", PrefixSuggester(), None, rng)
+        db.session.remove()
+        db.drop_all()
+
+    texts = list(zipf_texts(BANK_SIZE, VOCABULARY, rng))
+    measure(f"{VOCABULARY} word vocabulary", PrefixSuggester(), texts, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,73 @@
+import functools
+import io
 import os
 from unicodedata import category
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, stream_with_context
 from flask_cors import CORS
 import random
 import sys
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException, TooManyRequests
 
 from models import (
             setup_db,
+            config_setting,
+            database_path,
+            db,
+            fingerprint,
             Question,
             Category,
             QuestionSchema,
-            CategorySchema)
-
-QUESTIONS_PER_PAGE = 10
-
-
-def paginate_objects(request, selection):
-    page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    objects = [object.format() for object in selection]
-    current_objects = objects[start:end]
-
-    return current_objects
+            CategorySchema,
+            QuizAnswerSchema)
+from .pagination import paginate_query, next_cursor
+from .quiz import (
+            QUIZ_DECK_REFRESH,
+            QuizDecks,
+            QuizSessionStore,
+            requested_difficulty)
+from .search import SEARCH_INDEX_REFRESH, QuestionSearch, tokenize
+from .suggest import (
+            MAX_SUGGEST_LIMIT,
+            SUGGEST_LIMIT,
+            SUGGEST_MAX_TERMS,
+            SUGGEST_REFRESH,
+            PrefixSuggester)
+from .replicas import (
+            PRIMARY_COOKIE,
+            init_replicas,
+            primary_reads,
+            replica_reads,
+            replica_urls,
+            streamed_reads)
+from .results import ResultRecorder
+from .traffic import (
+            RATE_LIMIT_BURST,
+            RATE_LIMIT_RATE,
+            SingleFlight,
+            TokenBucketLimiter,
+            retry_after)
+from .tombstones import (
+            PURGE_INTERVAL,
+            delete_questions,
+            parse_question_ids,
+            start_purge)
+from .cache import CategoryCache, DataVersion, version_backend
+from .compression import init_compression, matching_etag
+from .commands import register_commands
+from .instrumentation import init_instrumentation
+from .serialization import (
+            QUESTION_FIELDS,
+            format_question_row,
+            init_json_provider,
+            question_rows)
+from .importer import detect_format, import_questions, read_rows
+from .exporter import (
+            EXPORT_MIMETYPES,
+            export_rows,
+            gzip_chunks,
+            serialize_rows)
 
 
 def format_categories(categories):
@@ -42,7 +85,71 @@ def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
 
-    setup_db(app)
+    if test_config is None:
+        setup_db(app)
+    else:
+        app.config.from_mapping(test_config)
+        setup_db(app, test_config.get("SQLALCHEMY_DATABASE_URI",
+                                      database_path))
+
+    quiz_sessions = QuizSessionStore()
+    result_recorder = ResultRecorder(app)
+    app.extensions["trivia_results"] = result_recorder
+    versions = version_backend(
+        config_setting(app.config, "CACHE_VERSION_URL"))
+    category_cache = CategoryCache(
+        lambda: format_categories(Category.query.order_by(Category.id).all()),
+        versions
+        )
+    data_version = DataVersion(versions)
+    app.extensions["trivia_data_version"] = data_version
+    question_search = QuestionSearch(
+        config_setting(app.config, "SEARCH_INDEX_REFRESH",
+                       SEARCH_INDEX_REFRESH),
+        data_version.get if data_version.shared else None
+        )
+    suggester = PrefixSuggester(
+        config_setting(app.config, "SUGGEST_MAX_TERMS", SUGGEST_MAX_TERMS),
+        config_setting(app.config, "SUGGEST_REFRESH", SUGGEST_REFRESH),
+        data_version.get if data_version.shared else None
+        )
+    quiz_decks = QuizDecks(
+        config_setting(app.config, "QUIZ_DECK_REFRESH", QUIZ_DECK_REFRESH),
+        data_version.get if data_version.shared else None
+        )
+    # per-process version stamps can't vouch for writes made by other
+    # workers or the CLI, so without a shared backend ETags are opt-in
+    conditional_get = config_setting(app.config, "CONDITIONAL_GET",
+                                     data_version.shared)
+    cache_control = "public, max-age={}, must-revalidate".format(
+        config_setting(app.config, "CACHE_MAX_AGE", 0))
+    flights = SingleFlight()
+    limiter = TokenBucketLimiter(
+        config_setting(app.config, "RATE_LIMIT_RATE", RATE_LIMIT_RATE),
+        config_setting(app.config, "RATE_LIMIT_BURST", RATE_LIMIT_BURST)
+        )
+
+    init_json_provider(app)
+    register_commands(app)
+
+    if config_setting(app.config, "QUIZ_DECK_REFILL", True):
+        quiz_decks.start_refill(app)
+
+    replicas = replica_urls(app.config)
+    if replicas:
+        init_replicas(app, replicas)
+
+    purge_interval = config_setting(app.config, "QUESTION_PURGE_INTERVAL",
+                                    PURGE_INTERVAL)
+    if purge_interval:
+        start_purge(app, purge_interval)
+
+    if config_setting(app.config, "COMPRESSION", True):
+        init_compression(app)
+
+    if app.config.get("INSTRUMENTATION",
+                      os.environ.get("TRIVIA_INSTRUMENTATION") == "1"):
+        init_instrumentation(app)
 
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -56,16 +163,127 @@ def create_app(test_config=None):
                              )
         return response
 
+    def respond_conditionally(etag, view, *args, **kwargs):
+        matched = matching_etag(request.if_none_match, etag)
+
+        if matched is not None:
+            response = app.response_class(status=304)
+            etag = matched
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+    def conditional(view):
+        """ETag/304 handling for read-only listings.
+
+        The ETag comes from the data version and the query string, read
+        before the view runs, so a matching If-None-Match is answered
+        without any SQL. Off unless CONDITIONAL_GET (or a shared version
+        backend) says every writer moves the same data version.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not conditional_get:
+                return view(*args, **kwargs)
+
+            return respond_conditionally(
+                data_version.etag(request.path, request.args),
+                view, *args, **kwargs)
+
+        return wrapper
+
+    def categories_conditional(view):
+        """ETag/304 handling for the category map.
+
+        The ETag hashes the cached map itself, so it holds in every
+        worker and is always on, whatever CONDITIONAL_GET says.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            _, etag = category_cache.get()
+            return respond_conditionally(etag, view, *args, **kwargs)
+
+        return wrapper
+
+    def coalesced(view):
+        """Single-flight for hot listings.
+
+        Concurrent requests for the same path, query string and data
+        version (and read-your-writes pin) wait for the first one and
+        share its serialized body instead of running the same queries.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not config_setting(app.config, "SINGLE_FLIGHT", True):
+                return view(*args, **kwargs)
+
+            key = (data_version.etag(request.path, request.args),
+                   bool(request.cookies.get(PRIMARY_COOKIE)))
+
+            def compute():
+                try:
+                    rv = view(*args, **kwargs)
+                except HTTPException as error:
+                    rv = app.handle_http_exception(error)
+                response = app.make_response(rv)
+                return (response.get_data(), response.status_code,
+                        response.headers.to_wsgi_list())
+
+            body, status, headers = flights.do(key, compute)
+            return app.response_class(body, status=status, headers=headers)
+
+        return wrapper
+
+    def rate_limited(view):
+        """Token bucket per API key (X-API-Key) or client address."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if config_setting(app.config, "RATE_LIMIT", True):
+                api_key = request.headers.get("X-API-Key")
+                client = (f"key:{api_key}" if api_key
+                          else f"ip:{request.remote_addr}")
+                wait = limiter.acquire(client)
+                if wait:
+                    raise TooManyRequests(retry_after=retry_after(wait))
+
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def selected_fields():
+        fields = request.args.get("fields")
+        if fields is None:
+            return None
+
+        fields = [field for field in fields.split(",") if field]
+        if len(fields) == 0 or not set(fields) <= set(QUESTION_FIELDS):
+            abort(400)
+
+        return fields
+
+    def listing_response(data):
+        # compact mode drops the success/status boilerplate
+        if request.args.get("compact", "false").lower() in ("1", "true"):
+            del data["success"]
+            del data["status"]
+
+        return jsonify(data)
+
     @app.route('/categories')
+    @categories_conditional
+    @coalesced
+    @replica_reads
     def get_categories():
-        categories = Category.query.order_by(Category.id).all()
-        formatted_categories = {}
+        formatted_categories, _ = category_cache.get()
 
-        if len(categories) == 0:
+        if len(formatted_categories) == 0:
             abort(404)
 
-        formatted_categories = format_categories(categories)
-
         return jsonify({
             "success": True,
             "status": 200,
@@ -73,84 +291,126 @@ def create_app(test_config=None):
         })
 
     @app.route('/questions')
+    @conditional
+    @coalesced
+    @replica_reads
     def get_questions():
         current_questions = []
-        formatted_categories = {}
         currentCategory = ""
+        fields = selected_fields()
 
-        questionSelection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_objects(request, questionSelection)
+        questionSelection, total_questions = paginate_query(
+            request, question_rows(), Question.id
+            )
+        current_questions = [
+            format_question_row(row, fields) for row in questionSelection
+            ]
 
         if len(current_questions) == 0:
             abort(404)
 
         question = random.choice(questionSelection)
-        currentCategory = Category.query.get(question.category).type
+        currentCategory = question.category_type or ""
 
-        categories = Category.query.order_by(Category.id).all()
-        if len(categories) > 0:
-            formatted_categories = format_categories(categories)
+        formatted_categories, categories_version = category_cache.get()
 
-        return jsonify({
+        data = {
             "success": True,
             "status": 200,
             "questions": current_questions,
-            "total_questions": len(questionSelection),
+            "total_questions": total_questions,
             'categories': formatted_categories,
-            "currentCategory": currentCategory
-        })
+            "categories_version": categories_version,
+            "currentCategory": currentCategory,
+            "next_after_id": next_cursor(questionSelection)
+        }
+        # a client that already holds this categories map doesn't need
+        # it again on every page
+        if request.args.get("categories_version") == categories_version:
+            del data["categories"]
+
+        return listing_response(data)
+
+    def remove_questions(ids):
+        # soft delete; the purge job removes the rows later
+        try:
+            deleted = delete_questions(ids)
+        except Exception:
+            print(sys.exc_info())
+            db.session.rollback()
+            abort(422)
+
+        if len(deleted) > 0:
+            quiz_decks.changed(removed_ids=deleted)
+            for question_id in deleted:
+                question_search.remove(question_id)
+            suggester.removed(deleted)
+
+        return deleted
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
-        question = Question.query.filter(
-            Question.id == question_id
-            ).one_or_none()
-
-        if question is None:
+        if len(remove_questions([question_id])) == 0:
             abort(404)
 
-        try:
-            question.delete()
-            return jsonify({
-                "success": True,
-                "status": 200,
-                "deleted": question_id
-            })
-        except Exception:
-            print(sys.exc_info())
-            abort(422)
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "deleted": question_id
+        })
 
-    @app.route("/questions", methods=["POST"])
-    def search_create_question():
-        body = request.get_json()
+    @app.route('/questions', methods=['DELETE'])
+    def delete_question_list():
+        ids = parse_question_ids(request.args.get("ids"))
+        if ids is None:
+            abort(400)
 
-        if 'searchTerm' in body:
-            searchTerm = body.get("searchTerm")
-            selection = Question.query.filter(
-                Question.question.ilike(f'%{searchTerm}%')
-                ).order_by(Question.id).all()
+        deleted = remove_questions(ids)
+        if len(deleted) == 0:
+            abort(404)
 
-            current_questions = paginate_objects(request, selection)
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "deleted": deleted,
+            "not_found": sorted(set(ids) - set(deleted))
+        })
 
-            if len(current_questions) == 0:
-                return jsonify({
-                    "success": True,
-                    "status": 200,
-                    "questions": current_questions,
-                    "totalQuestions": len(selection),
-                    "currentCategory": ""
-                })
+    @replica_reads
+    def search_questions(searchTerm):
+        selection, total_questions = question_search.search(
+            request, searchTerm
+            )
 
-            question = random.choice(selection)
-            currentCategory = Category.query.get(question.category).type
+        current_questions = [format_question_row(row) for row in selection]
 
+        if len(current_questions) == 0:
             return jsonify({
                 "success": True,
                 "status": 200,
                 "questions": current_questions,
-                "totalQuestions": len(selection),
-                "currentCategory": currentCategory
+                "totalQuestions": total_questions,
+                "currentCategory": ""
             })
+
+        question = random.choice(selection)
+        currentCategory = question.category_type or ""
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "questions": current_questions,
+            "totalQuestions": total_questions,
+            "currentCategory": currentCategory
+        })
+
+    @app.route("/questions", methods=["POST"])
+    @rate_limited
+    def search_create_question():
+        body = request.get_json()
+
+        if 'searchTerm' in body:
+            return search_questions(body.get("searchTerm"))
         else:
             try:
                 schema = QuestionSchema()
@@ -170,11 +430,11 @@ def create_app(test_config=None):
             if category is None:
                 abort(404, "category not found")
 
-            sameQuestions = Question.query.filter(
-                Question.question.ilike(f'%{new_question}%')
-                ).order_by(Question.id).all()
+            sameQuestion = Question.query.filter(
+                Question.fingerprint == fingerprint(new_question)
+                ).one_or_none()
 
-            if len(sameQuestions) > 0:
+            if sameQuestion is not None:
                 abort(409, "duplicated question")
 
             try:
@@ -185,19 +445,116 @@ def create_app(test_config=None):
                     difficulty=new_difficulty
                     )
                 question.insert()
-
-                selection = Question.query.order_by(Question.id).all()
-                current_questions = paginate_objects(request, selection)
+                quiz_decks.changed()
+                question_search.add(question)
+                suggester.add(question.question)
 
                 return jsonify({
                     "success": True,
-                    "status": 200
+                    "status": 200,
+                    "created": question.id,
+                    "question": question.format()
                 })
+            except IntegrityError:
+                # lost a race with a concurrent insert of the same question
+                db.session.rollback()
+                abort(409, "duplicated question")
             except Exception:
                 print(sys.exc_info())
                 abort(422)
 
+    @app.route("/questions/bulk", methods=["POST"])
+    def bulk_create_questions():
+        format = request.args.get("format") or detect_format(
+            mimetype=request.mimetype
+            )
+        if format not in ("jsonl", "csv"):
+            abort(400)
+
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8")
+        report = import_questions(read_rows(stream, format))
+
+        if report["inserted"] > 0:
+            quiz_decks.changed()
+            question_search.invalidate()
+            suggester.invalidate()
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            **report
+        })
+
+    @app.route('/questions/suggest')
+    def suggest_questions():
+        limit = request.args.get("limit", SUGGEST_LIMIT, type=int)
+        if limit < 1 or limit > MAX_SUGGEST_LIMIT:
+            abort(400)
+
+        # complete the last word typed, keeping the ones before it
+        words = tokenize(request.args.get("q", ""))
+        if len(words) == 0:
+            return jsonify({
+                "success": True,
+                "status": 200,
+                "suggestions": [],
+                "categories": []
+            })
+
+        *typed, prefix = words
+        suggestions = [
+            {"text": " ".join([*typed, term]), "count": count}
+            for term, count in suggester.suggest(prefix, limit)
+            ]
+
+        formatted_categories, _ = category_cache.get()
+        categories = [
+            {"id": category_id, "type": category_type}
+            for category_id, category_type in formatted_categories.items()
+            if any(token.startswith(prefix)
+                   for token in tokenize(category_type))
+            ][:limit]
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "suggestions": suggestions,
+            "categories": categories
+        })
+
+    @app.route("/questions/export")
+    @replica_reads
+    def export_questions():
+        format = request.args.get("format", "jsonl")
+        if format not in EXPORT_MIMETYPES:
+            abort(400)
+
+        category_id = request.args.get("category", None, type=int)
+        # the rows are read while the body streams, after replica_reads
+        # has returned, so a failing replica is left here
+        rows = streamed_reads(
+            export_rows(category_id),
+            lambda last: export_rows(
+                category_id, after_id=None if last is None else last[0])
+            )
+        chunks = serialize_rows(rows, format)
+
+        headers = {
+            "Content-Disposition":
+                f"attachment; filename=questions.{format}"
+        }
+        if request.args.get("gzip", "false").lower() in ("1", "true"):
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
+
+        return app.response_class(stream_with_context(chunks),
+                                  mimetype=EXPORT_MIMETYPES[format],
+                                  headers=headers)
+
     @app.route('/categories/<int:category_id>/questions')
+    @conditional
+    @coalesced
+    @replica_reads
     def get_category_questions(category_id):
         category = Category.query.filter(
             Category.id == category_id
@@ -206,27 +563,34 @@ def create_app(test_config=None):
         if category is None:
             abort(404, "category not found")
 
-        selection = Question.query.filter(
-            Question.category == category_id
-            ).order_by(Question.id).all()
+        fields = selected_fields()
+        # the total is the category's, counted by the same filtered query
+        selection, total_questions = paginate_query(
+            request,
+            question_rows().filter(Question.category == category_id),
+            Question.id
+            )
 
-        current_questions = paginate_objects(request, selection)
+        current_questions = [
+            format_question_row(row, fields) for row in selection
+            ]
 
         if len(current_questions) == 0:
-            return jsonify({
+            return listing_response({
                 "success": True,
                 "status": 200,
                 "questions": current_questions,
-                "totalQuestions": len(Question.query.all()),
+                "totalQuestions": total_questions,
                 "currentCategory": category.type
             })
 
-        return jsonify({
+        return listing_response({
             "success": True,
             "status": 200,
             "questions": current_questions,
-            "totalQuestions": len(Question.query.all()),
-            "currentCategory": category.type
+            "totalQuestions": total_questions,
+            "currentCategory": category.type,
+            "next_after_id": next_cursor(selection)
         })
 
     @app.route("/categories", methods=["POST"])
@@ -240,66 +604,197 @@ def create_app(test_config=None):
 
         new_type = body.get("type", None)
         sameCategory = Category.query.filter(
-            Category.type.ilike(f'%{new_type}%')
-            ).order_by(Category.id).all()
+            Category.fingerprint == fingerprint(new_type)
+            ).one_or_none()
 
-        if len(sameCategory) > 0:
+        if sameCategory is not None:
             abort(409, "duplicated category")
 
         try:
             category = Category(type=new_type)
             category.insert()
-
-            selection = Category.query.order_by(Category.id).all()
-            current_categories = format_categories(selection)
+            category_cache.invalidate()
 
             return jsonify({
                 "sucess": True,
                 "status": 200,
+                "created": category.id,
                 "added category": new_type
             })
+        except IntegrityError:
+            db.session.rollback()
+            abort(409, "duplicated category")
         except Exception:
             abort(422)
 
-    @app.route('/quizzes', methods=['POST'])
-    def quizz():
+    def quiz_category_id(quiz_category):
+        category = Category.query.filter(
+            Category.id == quiz_category['id']
+            ).one_or_none()
+
+        return None if category is None else category.id
+
+    def draw_question(category_id, seen, difficulty=None):
+        quiz_decks.expire_if_outdated()
+        for _ in range(2):
+            question_id = quiz_decks.draw(category_id, seen, difficulty)
+            if question_id is None:
+                return None
+
+            question = Question.query.get(question_id)
+            if question is None or question.deleted_at is not None:
+                # a lagging replica may not have the row yet
+                with primary_reads():
+                    question = Question.query.populate_existing().get(
+                        question_id)
+            if question is not None and question.deleted_at is None:
+                return question
+
+            # the decks are stale, a question was removed elsewhere
+            quiz_decks.changed(removed_id=question_id)
+
+        return None
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
         try:
             body = request.get_json()
-            previous_questions = body.get("previous_questions")
-            quiz_category_id = body.get("quiz_category")['id']
+            category_id = quiz_category_id(body.get("quiz_category"))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            abort(422)
 
-            category = Category.query.filter(
-                Category.id == quiz_category_id
-                ).one_or_none()
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "session": quiz_sessions.create(category_id,
+                                            bool(body.get("adaptive"))),
+            "expires_in": quiz_sessions.ttl
+        })
 
-            if category is None:
-                questions = Question.query.filter(
-                    ~Question.id.in_(previous_questions)
-                    ).order_by(Question.id).all()
+    @app.route('/quizzes/stats')
+    def get_quiz_stats():
+        return jsonify({
+            "success": True,
+            "status": 200,
+            **quiz_decks.stats(),
+            "results": result_recorder.stats()
+        })
 
+    @app.route('/stats')
+    def get_stats():
+        stats = {
+            "coalescing": flights.stats(),
+            "rate_limit": limiter.stats(),
+            "suggest": suggester.stats()
+        }
+        router = app.extensions.get("trivia_replicas")
+        if router is not None:
+            stats["replicas"] = router.stats()
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            **stats
+        })
+
+    @app.route('/quizzes/answers', methods=['POST'])
+    def record_quiz_answer():
+        try:
+            answer = QuizAnswerSchema().load(request.get_json())
+        except ValidationError:
+            abort(400)
+
+        category_id = answer["category"] or None
+        formatted_categories, _ = category_cache.get()
+        if category_id is not None and category_id not in formatted_categories:
+            abort(404, "category not found")
+
+        # buffered, written to the database in batches
+        result_recorder.record(answer["player"], answer["question"],
+                               answer["correct"], category_id)
+
+        return jsonify({
+            "success": True,
+            "status": 202
+        }), 202
+
+    @app.route('/leaderboard')
+    def get_leaderboard():
+        category_id = request.args.get("category", 0, type=int) or None
+        limit = request.args.get("limit", result_recorder.board_size,
+                                 type=int)
+        if limit < 1 or limit > result_recorder.board_size:
+            abort(400)
+
+        formatted_categories, _ = category_cache.get()
+        if category_id is not None and category_id not in formatted_categories:
+            abort(404, "category not found")
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "category": category_id,
+            "leaders": result_recorder.leaders(category_id, limit)
+        })
+
+    @app.route('/quizzes', methods=['POST'])
+    @replica_reads
+    def quizz():
+        body = request.get_json()
+
+        session = None
+        if body is not None and 'session' in body:
+            session = quiz_sessions.get(body.get("session"))
+            # sessions live in the worker that created them; elsewhere a
+            # client that also sent its previous questions plays on
+            if session is None and 'previous_questions' not in body:
+                abort(404, "quiz session not found")
+
+        # only malformed input is a 422; database errors must reach
+        # replica_reads so it can fail over to the primary
+        try:
+            if session is None:
+                seen = {
+                    int(question_id)
+                    for question_id in body.get("previous_questions")
+                    }
+                category_id = quiz_category_id(body.get("quiz_category"))
             else:
-                questions = Question.query.filter(
-                    ~Question.id.in_(previous_questions),
-                    Question.category == category.id
-                    ).order_by(Question.id).all()
+                seen = session.seen
+                category_id = session.category_id
 
-            if len(questions) == 0:
-                return jsonify({
-                    "success": True,
-                    "status": 200,
-                    "question": ""
-                })
+            difficulty = requested_difficulty(body, session)
+        except ValidationError:
+            abort(400)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            abort(422)
+
+        question = draw_question(category_id, seen, difficulty)
 
-            current_questions = paginate_objects(request, questions)
-            question = random.choice(current_questions)
+        # the session changes only once the turn can no longer fail, so a
+        # failover rerunning this view doesn't count the answer twice
+        if session is not None:
+            # the result of the previous question, for adaptive play
+            if body.get("correct") is not None:
+                session.record(body.get("correct"))
+            if question is not None:
+                session.seen.add(question.id)
 
+        if question is None:
             return jsonify({
                 "success": True,
                 "status": 200,
-                "question": question
+                "question": ""
             })
-        except Exception:
-            abort(422)
+
+        return jsonify({
+            "success": True,
+            "status": 200,
+            "question": question.format(),
+            # the nearest bucket may deal another level than asked for
+            "difficulty": question.difficulty,
+            "target_difficulty": difficulty
+        })
 
     @app.errorhandler(400)
     def bad_request(error):
@@ -324,6 +819,15 @@ def create_app(test_config=None):
                         "message": message}),
                 409)
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify({"success": False,
+                            "error": 429,
+                            "message": "too many requests"})
+        if error.retry_after is not None:
+            response.headers["Retry-After"] = str(error.retry_after)
+        return response, 429
+
     @app.errorhandler(422)
     def unprocessable(error):
         return (
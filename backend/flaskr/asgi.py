@@ -0,0 +1,771 @@
+import datetime
+import random
+
+from marshmallow import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from werkzeug.datastructures import MultiDict
+
+from models import (
+            config_setting,
+            database_path,
+            engine_options,
+            fingerprint,
+            local_statement_timeout,
+            set_local_statement_timeout,
+            soft_delete,
+            Question,
+            Category,
+            QuestionSchema,
+            CategorySchema)
+from .cache import CategoryCache, DataVersion, version_backend
+from .pagination import QUESTIONS_PER_PAGE
+from .quiz import (
+            QUIZ_DECK_REFRESH,
+            QuizDecks,
+            QuizSessionStore,
+            requested_difficulty)
+from .search import (
+            SEARCH_INDEX_REFRESH,
+            QuestionSearch,
+            count_batches,
+            fulltext_clauses,
+            tokenize)
+from .serialization import (
+            QUESTION_FIELDS,
+            format_question_row,
+            orjson,
+            question_columns)
+from .tombstones import parse_question_ids
+from .traffic import (
+            RATE_LIMIT_BURST,
+            RATE_LIMIT_RATE,
+            TokenBucketLimiter,
+            retry_after)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite"
+}
+
+ERROR_MESSAGES = {
+    400: "bad request",
+    404: "resource not found",
+    405: "method not allowed",
+    409: "resources conflict",
+    422: "unprocessable",
+    429: "too many requests"
+}
+
+CORS_HEADERS = [
+    (b"access-control-allow-headers", b"Content-Type, Authorization,true"),
+    (b"access-control-allow-methods", b"GET, POST, PATCH, DELETE, OPTIONS")
+]
+
+
+def async_database_url(url):
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise ValueError(f"no asyncio driver for {url.drivername}")
+
+    return url.set(drivername=drivername)
+
+
+"""
+async_engine_options(config, database_path)
+    the DB_* pool settings of engine_options() translated for asyncpg,
+    which takes server settings instead of a libpq options string and
+    must not cache prepared statements behind PgBouncer. There the
+    statement timeout is set per transaction instead, see create_asgi_app.
+"""
+
+
+def async_engine_options(config, database_path):
+    options = engine_options(config, database_path)
+
+    connect_args = {}
+    statement_timeout = options.pop("connect_args", {}).get("options")
+    if statement_timeout:
+        connect_args["server_settings"] = {
+            "statement_timeout": statement_timeout.split("=", 1)[1]
+        }
+    if options.get("poolclass") is not None:
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+    if connect_args:
+        options["connect_args"] = connect_args
+
+    return options
+
+
+class TriviaJSONResponse(JSONResponse):
+
+    def render(self, content):
+        if orjson is None:
+            return super().render(content)
+
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class CORSHeadersMiddleware:
+    """Adds the same CORS headers as the Flask after_request hook."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                message["headers"].extend(CORS_HEADERS)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def abort(status_code):
+    raise HTTPException(status_code)
+
+
+def query_flag(request, name):
+    return request.query_params.get(name, "false").lower() in ("1", "true")
+
+
+def selected_fields(request):
+    fields = request.query_params.get("fields")
+    if fields is None:
+        return None
+
+    fields = [field for field in fields.split(",") if field]
+    if len(fields) == 0 or not set(fields) <= set(QUESTION_FIELDS):
+        abort(400)
+
+    return fields
+
+
+def listing_response(request, data):
+    # compact mode drops the success/status boilerplate
+    if query_flag(request, "compact"):
+        del data["success"]
+        del data["status"]
+
+    return TriviaJSONResponse(data)
+
+
+def query_int(request, name, default=None):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def etag_matches(header, etag):
+    if header is None:
+        return False
+
+    for value in header.split(","):
+        value = value.strip()
+        if value == "*":
+            return True
+        if value.startswith("W/"):
+            value = value[2:]
+        if value.strip('"') == etag:
+            return True
+
+    return False
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        abort(400)
+
+
+def select_question_rows():
+    return select(*question_columns()).outerjoin(
+        Category, Question.category == Category.id
+        ).where(Question.live())
+
+
+"""
+paginate(session, request, statement, key)
+    asyncio counterpart of paginate_query(): LIMIT/OFFSET or the
+    ?after_id= keyset filter on `key`, plus a separate COUNT
+"""
+
+
+async def paginate(session, request, statement, key,
+                   per_page=QUESTIONS_PER_PAGE, with_total=True,
+                   order_by=None):
+    after_id = None
+    if order_by is None:
+        after_id = query_int(request, "after_id")
+        order_by = [key]
+
+    total = None
+    if with_total:
+        total = await session.scalar(
+            select(func.count()).select_from(statement.subquery())
+            )
+
+    if after_id is not None:
+        statement = statement.where(key > after_id)
+        start = 0
+    else:
+        page = query_int(request, "page", 1)
+        if page < 1:
+            return [], total
+        start = (page - 1) * per_page
+
+    result = await session.execute(
+        statement.order_by(*order_by).limit(per_page).offset(start)
+        )
+
+    return result.all(), total
+
+
+def next_cursor(selection, per_page=QUESTIONS_PER_PAGE):
+    if len(selection) < per_page:
+        return None
+
+    return selection[-1].id
+
+
+"""
+create_asgi_app(test_config)
+    the Trivia API on Starlette and SQLAlchemy's asyncio extension, so a
+    worker keeps serving other players while one request waits on the
+    database. It shares the schemas, caches and in-memory indexes of the
+    Flask app and answers its routes with the same JSON, ETags and rate
+    limit. The Flask app stays the only home of the CLI commands, bulk
+    import/export, /questions/suggest, the quiz answers, leaderboard and
+    stats routes, /metrics, read replicas and compression.
+"""
+
+
+def create_asgi_app(test_config=None):
+    config = dict(test_config or {})
+    url = config.get("SQLALCHEMY_DATABASE_URI", database_path)
+
+    engine = create_async_engine(async_database_url(url),
+                                 **async_engine_options(config, url))
+    set_local_statement_timeout(engine.sync_engine,
+                                local_statement_timeout(config))
+    Session = sessionmaker(engine, class_=AsyncSession,
+                           expire_on_commit=False)
+
+    quiz_sessions = QuizSessionStore()
+    versions = version_backend(
+        config_setting(config, "CACHE_VERSION_URL"))
+    category_cache = CategoryCache(backend=versions)
+    # writes here don't go through the model methods; bump the shared
+    # data version so the Flask workers' ETags move too
+    data_version = DataVersion(versions)
+    question_search = QuestionSearch(
+        config_setting(config, "SEARCH_INDEX_REFRESH", SEARCH_INDEX_REFRESH),
+        data_version.get if data_version.shared else None
+        )
+    quiz_decks = QuizDecks(
+        config_setting(config, "QUIZ_DECK_REFRESH", QUIZ_DECK_REFRESH),
+        data_version.get if data_version.shared else None
+        )
+    # the same ETags as the Flask app, see its `conditional`
+    conditional_get = config_setting(config, "CONDITIONAL_GET",
+                                     data_version.shared)
+    cache_control = "public, max-age={}, must-revalidate".format(
+        config_setting(config, "CACHE_MAX_AGE", 0))
+    limiter = TokenBucketLimiter(
+        config_setting(config, "RATE_LIMIT_RATE", RATE_LIMIT_RATE),
+        config_setting(config, "RATE_LIMIT_BURST", RATE_LIMIT_BURST)
+        )
+
+    def conditional(view):
+        async def wrapper(request):
+            if not conditional_get:
+                return await view(request)
+
+            etag = data_version.etag(
+                request.url.path, MultiDict(request.query_params.multi_items())
+                )
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                response = Response(status_code=304)
+            else:
+                response = await view(request)
+                if response.status_code != 200:
+                    return response
+
+            response.headers["ETag"] = f'"{etag}"'
+            response.headers["Cache-Control"] = cache_control
+            return response
+
+        return wrapper
+
+    def rate_limited(view):
+        async def wrapper(request):
+            if config_setting(config, "RATE_LIMIT", True):
+                api_key = request.headers.get("x-api-key")
+                client = (f"key:{api_key}" if api_key
+                          else f"ip:{request.client.host}")
+                wait = limiter.acquire(client)
+                if wait:
+                    raise HTTPException(
+                        429, headers={"Retry-After": str(retry_after(wait))}
+                        )
+
+            return await view(request)
+
+        return wrapper
+
+    # the decks and the search index build themselves through the Flask
+    # session; here they are filled from an async query right before each
+    # synchronous use, with no await in between. Without a refill thread
+    # the decks are dropped on every write and rebuilt on the next turn.
+    async def load_quiz_decks(session):
+        quiz_decks.expire_if_outdated()
+        if not quiz_decks.built:
+            result = await session.execute(
+                select(Question.id, Question.category,
+                       Question.difficulty).where(Question.live())
+                )
+            quiz_decks.build(result.all())
+
+    async def load_search_index(session):
+        question_search.index.expire_if_outdated()
+        if not question_search.index.built:
+            result = await session.execute(
+                select(Question.id, Question.question).where(Question.live())
+                )
+            question_search.index.build(result.all())
+
+    async def uses_fulltext(session):
+        return await session.run_sync(
+            lambda sync_session: question_search.uses_fulltext(
+                sync_session.connection()
+                )
+            )
+
+    async def formatted_categories(session):
+        cached = category_cache.current()
+        if cached is not None:
+            return cached
+
+        version = category_cache.version()
+        result = await session.execute(
+            select(Category.id, Category.type).order_by(Category.id)
+            )
+        return category_cache.update(dict(result.all()), version)
+
+    async def get_categories(request):
+        async with Session() as session:
+            categories, etag = await formatted_categories(session)
+
+        # the content hash holds in every worker, so unlike the data
+        # version ETags this one is always on
+        headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if len(categories) == 0:
+            abort(404)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "categories": categories
+        }, headers=headers)
+
+    async def get_questions(request):
+        fields = selected_fields(request)
+
+        async with Session() as session:
+            selection, total_questions = await paginate(
+                session, request, select_question_rows(), Question.id
+                )
+
+            if len(selection) == 0:
+                abort(404)
+
+            categories, categories_version = await formatted_categories(
+                session)
+
+        data = {
+            "success": True,
+            "status": 200,
+            "questions": [format_question_row(row, fields)
+                          for row in selection],
+            "total_questions": total_questions,
+            "categories": categories,
+            "categories_version": categories_version,
+            "currentCategory":
+                random.choice(selection).category_type or "",
+            "next_after_id": next_cursor(selection)
+        }
+        if request.query_params.get("categories_version") == \
+                categories_version:
+            del data["categories"]
+
+        return listing_response(request, data)
+
+    async def remove_questions(ids):
+        # soft delete, like flaskr.tombstones.delete_questions()
+        ids = sorted(set(ids))
+        stamp = datetime.datetime.utcnow()
+
+        async with Session() as session:
+            try:
+                result = await session.execute(soft_delete(ids, stamp))
+                deleted = ids
+                if result.rowcount != len(ids):
+                    result = await session.execute(
+                        select(Question.id).where(
+                            Question.id.in_(ids),
+                            Question.deleted_at == stamp
+                            ).order_by(Question.id)
+                        )
+                    deleted = result.scalars().all()
+                await session.commit()
+            except Exception:
+                abort(422)
+
+        if len(deleted) > 0:
+            data_version.bump()
+            quiz_decks.changed(removed_ids=deleted)
+            for question_id in deleted:
+                question_search.remove(question_id)
+
+        return deleted
+
+    async def delete_question(request):
+        question_id = request.path_params["question_id"]
+
+        if len(await remove_questions([question_id])) == 0:
+            abort(404)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "deleted": question_id
+        })
+
+    async def delete_question_list(request):
+        ids = parse_question_ids(request.query_params.get("ids"))
+        if ids is None:
+            abort(400)
+
+        deleted = await remove_questions(ids)
+        if len(deleted) == 0:
+            abort(404)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "deleted": deleted,
+            "not_found": sorted(set(ids) - set(deleted))
+        })
+
+    async def search_questions(session, request, term):
+        if len(tokenize(term)) == 0:
+            return await paginate(session, request, select_question_rows(),
+                                  Question.id)
+
+        if await uses_fulltext(session):
+            match, rank = fulltext_clauses(term)
+            return await paginate(session, request,
+                                  select_question_rows().where(match),
+                                  Question.id,
+                                  order_by=[rank.desc(), Question.id])
+
+        await load_search_index(session)
+        ids = question_search.index.search(term)
+        if len(ids) == 0:
+            return [], 0
+
+        # see QuestionSearch._search_index
+        total = 0
+        for batch in count_batches(ids):
+            total += await session.scalar(
+                select(func.count(Question.id)).where(
+                    Question.id.in_(batch), Question.live()
+                    )
+                )
+
+        page = query_int(request, "page", 1)
+        start = (page - 1) * QUESTIONS_PER_PAGE
+        page_ids = ids[start:start + QUESTIONS_PER_PAGE] if page > 0 else []
+        if len(page_ids) == 0:
+            return [], total
+
+        result = await session.execute(
+            select_question_rows().where(Question.id.in_(page_ids))
+            )
+        rows = {row.id: row for row in result}
+        question_search.drop_missing(page_ids, rows)
+
+        return [rows[i] for i in page_ids if i in rows], total
+
+    async def create_question(session, body):
+        try:
+            result = QuestionSchema().load(body)
+        except ValidationError:
+            abort(400)
+
+        if await session.get(Category, result["category"]) is None:
+            abort(404)
+
+        same_question = await session.scalar(
+            select(Question.id).where(
+                Question.fingerprint == fingerprint(result["question"])
+                )
+            )
+        if same_question is not None:
+            abort(409)
+
+        question = Question(**result)
+        try:
+            session.add(question)
+            await session.commit()
+        except IntegrityError:
+            # lost a race with a concurrent insert of the same question
+            await session.rollback()
+            abort(409)
+
+        data_version.bump()
+        quiz_decks.changed()
+        question_search.add(question)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "created": question.id,
+            "question": question.format()
+        })
+
+    async def search_create_question(request):
+        body = await read_json(request)
+
+        async with Session() as session:
+            if "searchTerm" not in body:
+                return await create_question(session, body)
+
+            selection, total_questions = await search_questions(
+                session, request, body.get("searchTerm")
+                )
+
+        current_category = ""
+        if len(selection) > 0:
+            current_category = random.choice(selection).category_type or ""
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "questions": [format_question_row(row) for row in selection],
+            "totalQuestions": total_questions,
+            "currentCategory": current_category
+        })
+
+    async def get_category_questions(request):
+        category_id = request.path_params["category_id"]
+        fields = selected_fields(request)
+
+        async with Session() as session:
+            category = await session.get(Category, category_id)
+            if category is None:
+                abort(404)
+
+            selection, total_questions = await paginate(
+                session, request,
+                select_question_rows().where(
+                    Question.category == category_id
+                    ),
+                Question.id
+                )
+
+        data = {
+            "success": True,
+            "status": 200,
+            "questions": [format_question_row(row, fields)
+                          for row in selection],
+            "totalQuestions": total_questions,
+            "currentCategory": category.type
+        }
+        if len(selection) > 0:
+            data["next_after_id"] = next_cursor(selection)
+
+        return listing_response(request, data)
+
+    async def create_category(request):
+        body = await read_json(request)
+        try:
+            result = CategorySchema().load(body)
+        except ValidationError as err:
+            return TriviaJSONResponse(err.messages, status_code=400)
+
+        async with Session() as session:
+            same_category = await session.scalar(
+                select(Category.id).where(
+                    Category.fingerprint == fingerprint(result["type"])
+                    )
+                )
+            if same_category is not None:
+                abort(409)
+
+            category = Category(type=result["type"])
+            try:
+                session.add(category)
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                abort(409)
+
+        category_cache.invalidate()
+        data_version.bump()
+
+        return TriviaJSONResponse({
+            "sucess": True,
+            "status": 200,
+            "created": category.id,
+            "added category": category.type
+        })
+
+    async def quiz_category_id(session, quiz_category):
+        category = await session.get(Category, int(quiz_category["id"]))
+
+        return None if category is None else category.id
+
+    async def draw_question(session, category_id, seen, difficulty=None):
+        for _ in range(2):
+            await load_quiz_decks(session)
+            question_id = quiz_decks.draw(category_id, seen, difficulty)
+            if question_id is None:
+                return None
+
+            question = await session.get(Question, question_id)
+            if question is not None and question.deleted_at is None:
+                return question
+
+            # the decks are stale, a question was removed elsewhere
+            quiz_decks.changed(removed_id=question_id)
+
+        return None
+
+    async def create_quiz_session(request):
+        body = await read_json(request)
+
+        async with Session() as session:
+            try:
+                category_id = await quiz_category_id(
+                    session, body.get("quiz_category")
+                    )
+            except Exception:
+                abort(422)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "session": quiz_sessions.create(category_id,
+                                            bool(body.get("adaptive"))),
+            "expires_in": quiz_sessions.ttl
+        })
+
+    async def quizz(request):
+        body = await read_json(request)
+
+        quiz_session = None
+        if body is not None and "session" in body:
+            quiz_session = quiz_sessions.get(body.get("session"))
+            if quiz_session is None and "previous_questions" not in body:
+                abort(404)
+
+        async with Session() as session:
+            try:
+                if quiz_session is None:
+                    seen = {
+                        int(question_id)
+                        for question_id in body.get("previous_questions")
+                        }
+                    category_id = await quiz_category_id(
+                        session, body.get("quiz_category")
+                        )
+                else:
+                    seen = quiz_session.seen
+                    category_id = quiz_session.category_id
+
+                difficulty = requested_difficulty(body, quiz_session)
+                question = await draw_question(session, category_id, seen,
+                                               difficulty)
+            except ValidationError:
+                abort(400)
+            except Exception:
+                abort(422)
+
+        if quiz_session is not None and body.get("correct") is not None:
+            quiz_session.record(body.get("correct"))
+
+        if question is None:
+            return TriviaJSONResponse({
+                "success": True,
+                "status": 200,
+                "question": ""
+            })
+
+        if quiz_session is not None:
+            quiz_session.seen.add(question.id)
+
+        return TriviaJSONResponse({
+            "success": True,
+            "status": 200,
+            "question": question.format(),
+            "difficulty": question.difficulty,
+            "target_difficulty": difficulty
+        })
+
+    async def http_error(request, exc):
+        return TriviaJSONResponse({
+            "success": False,
+            "error": exc.status_code,
+            "message": ERROR_MESSAGES.get(exc.status_code, exc.detail)
+        }, status_code=exc.status_code, headers=exc.headers)
+
+    routes = [
+        Route("/categories", get_categories),
+        Route("/categories", create_category, methods=["POST"]),
+        Route("/questions", conditional(get_questions)),
+        Route("/questions", rate_limited(search_create_question),
+              methods=["POST"]),
+        Route("/questions", delete_question_list, methods=["DELETE"]),
+        Route("/questions/{question_id:int}", delete_question,
+              methods=["DELETE"]),
+        Route("/categories/{category_id:int}/questions",
+              conditional(get_category_questions)),
+        Route("/quizzes/sessions", create_quiz_session, methods=["POST"]),
+        Route("/quizzes", quizz, methods=["POST"]),
+    ]
+
+    async def connect():
+        # SQLAlchemy runs its first-connect hook under a thread lock, which
+        # deadlocks when several tasks open the first connection at once;
+        # open it before serving
+        async with engine.connect():
+            pass
+
+    app = Starlette(routes=routes,
+                    exception_handlers={HTTPException: http_error},
+                    on_startup=[connect],
+                    on_shutdown=[engine.dispose])
+    app.add_middleware(CORSHeadersMiddleware)
+    app.state.engine = engine
+    app.state.data_version = data_version
+
+    return app
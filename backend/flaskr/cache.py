@@ -0,0 +1,167 @@
+import hashlib
+import json
+import secrets
+import threading
+
+
+"""
+LocalVersionBackend
+    in-process stand-in for a shared version store; with a single worker
+    (or in tests) it behaves exactly like the shared backend. Its stamps
+    start over with every process, so `epoch` is random per process:
+    stamps of two processes never compare equal.
+"""
+
+
+class LocalVersionBackend:
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.epoch = secrets.token_hex(8)
+
+    def get(self, key):
+        return self._versions.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+
+"""
+RedisVersionBackend
+    keeps version stamps in Redis so every gunicorn worker sees the same
+    version; needs the optional `redis` package. The epoch is stored
+    next to the stamps, so it changes when Redis loses them.
+"""
+
+
+class RedisVersionBackend:
+    shared = True
+
+    def __init__(self, url, prefix="trivia:version:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._epoch = None
+
+    @property
+    def epoch(self):
+        if self._epoch is None:
+            key = self._prefix + "epoch"
+            self._client.set(key, secrets.token_hex(8), nx=True)
+            self._epoch = self._client.get(key).decode()
+
+        return self._epoch
+
+    def get(self, key):
+        return int(self._client.get(self._prefix + key) or 0)
+
+    def incr(self, key):
+        return self._client.incr(self._prefix + key)
+
+
+def version_backend(url=None):
+    if url is None:
+        return LocalVersionBackend()
+
+    return RedisVersionBackend(url)
+
+
+"""
+CategoryCache
+    read-through cache of the formatted category map. The map is reloaded
+    only when the version stamp in the backend moves, which happens on
+    every category write through invalidate().
+"""
+
+
+class CategoryCache:
+    key = "categories"
+
+    def __init__(self, loader=None, backend=None):
+        self._loader = loader
+        self._backend = backend or LocalVersionBackend()
+        self._lock = threading.Lock()
+        self._version = None
+        self._categories = None
+        self._etag = None
+
+    def version(self):
+        return self._backend.get(self.key)
+
+    def current(self):
+        version = self.version()
+
+        with self._lock:
+            if self._categories is None or self._version != version:
+                return None
+
+            return self._categories, self._etag
+
+    def update(self, categories, version=None):
+        if version is None:
+            version = self.version()
+        etag = hashlib.sha1(
+            json.dumps(categories, sort_keys=True).encode()
+            ).hexdigest()
+
+        with self._lock:
+            self._categories = categories
+            self._etag = etag
+            self._version = version
+
+        return categories, etag
+
+    def get(self):
+        cached = self.current()
+        if cached is not None:
+            return cached
+
+        # read the stamp before loading so a write racing the load leaves
+        # the cache stale rather than wrongly fresh
+        version = self.version()
+        return self.update(self._loader(), version)
+
+    def invalidate(self):
+        self._backend.incr(self.key)
+
+
+"""
+DataVersion
+    counter of committed question/category writes, bumped by the model
+    write methods. Listing ETags are derived from it and the backend's
+    epoch, so a conditional GET is answered without touching the
+    database. They can only be trusted when every writer bumps the same
+    counter, i.e. with a shared backend (see `shared`).
+"""
+
+
+class DataVersion:
+    key = "data"
+
+    def __init__(self, backend=None):
+        self._backend = backend or LocalVersionBackend()
+
+    @property
+    def shared(self):
+        return self._backend.shared
+
+    def get(self):
+        return self._backend.get(self.key)
+
+    def bump(self):
+        return self._backend.incr(self.key)
+
+    def etag(self, path, args, version=None):
+        if version is None:
+            version = self.get()
+        query = "&".join(f"{key}={value}"
+                         for key, value in sorted(args.items(multi=True)))
+
+        return hashlib.sha1(
+            f"{self._backend.epoch}:{version}:{path}?{query}".encode()
+            ).hexdigest()
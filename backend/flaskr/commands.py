@@ -0,0 +1,72 @@
+import click
+
+from .duplicates import find_near_duplicates
+from .exporter import export_rows, gzip_chunks, serialize_rows
+from .importer import (
+    IMPORT_BATCH_SIZE,
+    detect_format,
+    import_questions,
+    read_rows)
+from .tombstones import PURGE_AFTER, PURGE_BATCH_SIZE, purge_questions
+
+
+def register_commands(app):
+
+    @app.cli.command("find-near-duplicates")
+    @click.option("--threshold", default=0.8, show_default=True,
+                  help="Minimum estimated Jaccard similarity to report.")
+    def find_near_duplicates_command(threshold):
+        """Report pairs of questions that are near duplicates."""
+        pairs = find_near_duplicates(threshold)
+        for question_id, other_id, similarity in pairs:
+            click.echo(f"{question_id}\t{other_id}\t{similarity:.2f}")
+
+        click.echo(f"{len(pairs)} near-duplicate pair(s)", err=True)
+
+    @app.cli.command("import-questions")
+    @click.argument("source", type=click.File("r", encoding="utf-8"))
+    @click.option("--format", "format", type=click.Choice(["jsonl", "csv"]),
+                  default=None, help="Defaults to the file extension.")
+    @click.option("--batch-size", default=IMPORT_BATCH_SIZE,
+                  show_default=True)
+    def import_questions_command(source, format, batch_size):
+        """Bulk load questions from a JSON Lines or CSV file ('-' = stdin)."""
+        if format is None:
+            format = detect_format(source.name)
+
+        report = import_questions(read_rows(source, format), batch_size)
+
+        for error in report["errors"]:
+            click.echo(f"line {error['line']}: {error['messages']}", err=True)
+        click.echo(f"inserted {report['inserted']}, "
+                   f"skipped {report['duplicates']} duplicate(s), "
+                   f"{len(report['errors'])} error(s) "
+                   f"in {report['elapsed']:.2f}s "
+                   f"({report['rows_per_second']:.0f} rows/s)")
+
+    @app.cli.command("export-questions")
+    @click.argument("output", type=click.File("wb"), default="-")
+    @click.option("--format", "format", type=click.Choice(["jsonl", "csv"]),
+                  default="jsonl", show_default=True)
+    @click.option("--category", type=int, default=None,
+                  help="Only export questions of this category id.")
+    @click.option("--gzip", "compress", is_flag=True,
+                  help="Compress the output with gzip.")
+    def export_questions_command(output, format, category, compress):
+        """Stream the question bank as JSON Lines or CSV ('-' = stdout)."""
+        chunks = serialize_rows(export_rows(category), format)
+        if compress:
+            chunks = gzip_chunks(chunks)
+
+        for chunk in chunks:
+            output.write(chunk)
+
+    @app.cli.command("purge-questions")
+    @click.option("--older-than", default=PURGE_AFTER, show_default=True,
+                  help="Only purge questions deleted this many seconds ago.")
+    @click.option("--batch-size", default=PURGE_BATCH_SIZE,
+                  show_default=True)
+    def purge_questions_command(older_than, batch_size):
+        """Hard delete soft-deleted questions in batches."""
+        purged = purge_questions(older_than, batch_size)
+        click.echo(f"purged {purged} deleted question(s)")
@@ -0,0 +1,82 @@
+import gzip
+
+from flask import request
+
+from models import config_setting
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+ENCODINGS = ("br", "gzip")
+
+
+def negotiate_encoding(accept_encodings):
+    for encoding in ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+
+    return gzip.compress(data, compresslevel=6)
+
+
+"""
+matching_etag(if_none_match, etag)
+    a compressed body is tagged `<etag>-<encoding>`, so a client that
+    cached it revalidates with that tag; returns whichever variant the
+    client sent, or None
+"""
+
+
+def matching_etag(if_none_match, etag):
+    for variant in (etag, *(f"{etag}-{encoding}" for encoding in ENCODINGS)):
+        if if_none_match.contains(variant):
+            return variant
+
+    return None
+
+
+"""
+init_compression(app)
+    gzip (or brotli, when the optional `brotli` package is installed)
+    encodes 200 responses of at least COMPRESS_MIN_SIZE bytes for clients
+    that accept it. Streamed responses, like the export, are left alone.
+"""
+
+
+def init_compression(app):
+
+    @app.after_request
+    def compress_response(response):
+        min_size = config_setting(app.config, "COMPRESS_MIN_SIZE",
+                                  COMPRESS_MIN_SIZE)
+        if (response.status_code != 200
+                or response.is_streamed
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.content_length is None
+                or response.content_length < min_size):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag(f"{etag}-{encoding}", weak)
+
+        return response
@@ -0,0 +1,77 @@
+import hashlib
+import struct
+from itertools import combinations
+
+from models import db, normalize_text, Question
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 3
+MAX_HASH = (1 << 64) - 1
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = normalize_text(text or "").split()
+    if len(words) <= size:
+        return {" ".join(words)}
+
+    return {" ".join(words[i:i + size])
+            for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set):
+    signature = [MAX_HASH] * NUM_HASHES
+    for shingle in shingle_set:
+        digest = hashlib.blake2b(shingle.encode("utf-8"),
+                                 digest_size=16).digest()
+        a, b = struct.unpack("<QQ", digest)
+        # double hashing: h_i = a + i * b simulates NUM_HASHES hash functions
+        for i in range(NUM_HASHES):
+            value = (a + i * b) & MAX_HASH
+            if value < signature[i]:
+                signature[i] = value
+
+    return signature
+
+
+def estimate_similarity(left, right):
+    same = sum(1 for a, b in zip(left, right) if a == b)
+    return same / NUM_HASHES
+
+
+"""
+find_near_duplicates(threshold)
+    batch job: MinHash signatures over word shingles, bucketed with
+    locality-sensitive hashing so only candidate pairs are compared.
+    Returns (question_id, other_id, similarity) tuples.
+"""
+
+
+def find_near_duplicates(threshold=0.8, batch_size=1000):
+    signatures = {}
+    buckets = {}
+
+    query = db.session.query(Question.id, Question.question).filter(
+        Question.live()
+        ).order_by(Question.id).yield_per(batch_size)
+    for question_id, text in query:
+        signature = minhash(shingles(text))
+        signatures[question_id] = signature
+        for band in range(BANDS):
+            key = (band, tuple(signature[band * ROWS:(band + 1) * ROWS]))
+            buckets.setdefault(key, []).append(question_id)
+
+    candidates = set()
+    for ids in buckets.values():
+        if len(ids) > 1:
+            candidates.update(combinations(ids, 2))
+
+    pairs = []
+    for question_id, other_id in sorted(candidates):
+        similarity = estimate_similarity(signatures[question_id],
+                                         signatures[other_id])
+        if similarity >= threshold:
+            pairs.append((question_id, other_id, similarity))
+
+    return pairs
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import zlib
+
+from models import db, Question
+
+EXPORT_FIELDS = ("id", "question", "answer", "difficulty", "category")
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MIMETYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+"""
+export_rows(category_id, after_id)
+    yields question rows as plain tuples through a server-side cursor, so
+    memory stays flat however large the table is. Rows come in id order,
+    so an export cut short can resume after the last id it wrote.
+"""
+
+
+def export_rows(category_id=None, batch_size=EXPORT_BATCH_SIZE,
+                after_id=None):
+    query = db.session.query(
+        *[getattr(Question, field) for field in EXPORT_FIELDS]
+        ).filter(Question.live())
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    if after_id is not None:
+        query = query.filter(Question.id > after_id)
+
+    return query.order_by(Question.id).execution_options(
+        stream_results=True
+        ).yield_per(batch_size)
+
+
+def serialize_rows(rows, format="jsonl", batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+
+    if format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row))))
+            buffer.write("\n")
+
+    # emit one chunk per batch instead of one per row
+    for count, row in enumerate(rows, start=1):
+        write(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
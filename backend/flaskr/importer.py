@@ -0,0 +1,154 @@
+import csv
+import json
+import time
+
+from marshmallow import EXCLUDE
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+            bump_data_version,
+            db,
+            fingerprint,
+            Question,
+            Category,
+            QuestionSchema)
+
+IMPORT_BATCH_SIZE = 1000
+
+
+def read_rows(stream, format="jsonl"):
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield line_number, None, {"_schema": [f"invalid JSON: {err}"]}
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, {"_schema": ["expected a JSON object"]}
+            continue
+        yield line_number, row, None
+
+
+def detect_format(filename=None, mimetype=None):
+    if (filename or "").lower().endswith(".csv") or mimetype == "text/csv":
+        return "csv"
+
+    return "jsonl"
+
+
+"""
+import_questions(rows)
+    validates rows with QuestionSchema(many=True) and inserts them with one
+    executemany INSERT and one commit per batch. Duplicates (inside the file
+    or already stored) are skipped with a single fingerprint probe per batch.
+    Returns a report with per-line errors and the throughput.
+"""
+
+
+def import_questions(rows, batch_size=IMPORT_BATCH_SIZE):
+    report = {
+        "inserted": 0,
+        "duplicates": 0,
+        "errors": [],
+        "elapsed": 0.0,
+        "rows_per_second": 0.0
+    }
+    schema = QuestionSchema(many=True, unknown=EXCLUDE)
+    category_ids = {
+        category_id for category_id, in db.session.query(Category.id)
+        }
+    seen = set()
+    batch = []
+    started = time.perf_counter()
+    total = 0
+
+    def flush():
+        lines = [line_number for line_number, _ in batch]
+        data = [row for _, row in batch]
+        batch.clear()
+
+        errors = schema.validate(data)
+        for index in sorted(errors):
+            report["errors"].append({"line": lines[index],
+                                     "messages": errors[index]})
+        valid = [(lines[i], row) for i, row in enumerate(data)
+                 if i not in errors]
+        loaded = schema.load([row for _, row in valid])
+
+        candidates = []
+        for (line_number, _), row in zip(valid, loaded):
+            if row["category"] not in category_ids:
+                report["errors"].append({
+                    "line": line_number,
+                    "messages": {"category": ["category not found"]}
+                    })
+                continue
+            row["fingerprint"] = fingerprint(row["question"])
+            if row["fingerprint"] in seen:
+                report["duplicates"] += 1
+                continue
+            seen.add(row["fingerprint"])
+            candidates.append(row)
+
+        if len(candidates) == 0:
+            return
+
+        existing = {
+            value for value, in db.session.query(Question.fingerprint).filter(
+                Question.fingerprint.in_(
+                    [row["fingerprint"] for row in candidates]
+                    )
+                )
+            }
+        new_rows = [row for row in candidates
+                    if row["fingerprint"] not in existing]
+        report["duplicates"] += len(candidates) - len(new_rows)
+
+        if len(new_rows) == 0:
+            return
+
+        try:
+            db.session.execute(Question.__table__.insert(), new_rows)
+            db.session.commit()
+            report["inserted"] += len(new_rows)
+        except IntegrityError:
+            # a concurrent writer stored some of these questions first;
+            # retry row by row so only the conflicting rows are skipped
+            db.session.rollback()
+            for row in new_rows:
+                try:
+                    db.session.execute(Question.__table__.insert(), row)
+                    db.session.commit()
+                    report["inserted"] += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    report["duplicates"] += 1
+
+    for line_number, row, error in rows:
+        total += 1
+        if error is not None:
+            report["errors"].append({"line": line_number, "messages": error})
+            continue
+        batch.append((line_number, row))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if report["inserted"] > 0:
+        bump_data_version()
+
+    report["errors"].sort(key=lambda error: error["line"])
+    report["elapsed"] = round(time.perf_counter() - started, 3)
+    if report["elapsed"] > 0:
+        report["rows_per_second"] = round(total / report["elapsed"], 1)
+
+    return report
@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [
+                [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_text = format_labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},'
+                             f'le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} '
+                         f'{count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = {}
+
+    def inc(self, labels, value=1):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{format_labels(labels)}}} {value}")
+
+        return lines
+
+
+def format_labels(labels):
+    method, route, status = labels
+    return f'method="{method}",route="{route}",status="{status}"'
+
+
+"""
+Metrics
+    process-local per-route metrics rendered in the Prometheus text format.
+    Each gunicorn worker keeps its own series, scrape them per worker.
+"""
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram(
+            "trivia_request_duration_seconds",
+            "Total time spent handling the request.",
+            LATENCY_BUCKETS)
+        self.db_seconds = Histogram(
+            "trivia_request_db_seconds",
+            "Time spent executing SQL statements per request.",
+            LATENCY_BUCKETS)
+        self.serialization_seconds = Histogram(
+            "trivia_request_serialization_seconds",
+            "Time spent encoding JSON per request.",
+            LATENCY_BUCKETS)
+        self.queries = Histogram(
+            "trivia_request_db_queries",
+            "SQL statements executed per request.",
+            QUERY_BUCKETS)
+        self.rows = Counter(
+            "trivia_db_rows_fetched_total",
+            "Rows reported by the DBAPI cursor for SELECT statements.")
+
+    def observe(self, labels, stats, total):
+        with self._lock:
+            self.request_seconds.observe(labels, total)
+            self.db_seconds.observe(labels, stats["db_time"])
+            self.serialization_seconds.observe(labels, stats["json_time"])
+            self.queries.observe(labels, stats["queries"])
+            self.rows.inc(labels, stats["rows"])
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_seconds, self.db_seconds,
+                           self.serialization_seconds, self.queries,
+                           self.rows):
+                lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+def request_stats():
+    if not has_request_context():
+        return None
+
+    return g.get("request_stats")
+
+
+def listen_to_engine(engine):
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if request_stats() is not None:
+            context._trivia_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        stats = request_stats()
+        started = getattr(context, "_trivia_started", None)
+        if stats is None or started is None:
+            return
+
+        stats["db_time"] += time.perf_counter() - started
+        stats["queries"] += 1
+        # psycopg2 reports the row count of a SELECT, SQLite reports -1
+        if cursor.description is not None and cursor.rowcount > 0:
+            stats["rows"] += cursor.rowcount
+
+
+def time_json(provider):
+    dumps = provider.dumps
+
+    def timed_dumps(obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return dumps(obj, **kwargs)
+        finally:
+            stats = request_stats()
+            if stats is not None:
+                stats["json_time"] += time.perf_counter() - started
+
+    provider.dumps = timed_dumps
+
+
+"""
+init_instrumentation(app)
+    opt-in (INSTRUMENTATION config or TRIVIA_INSTRUMENTATION env var):
+    records SQL count, DB time, rows fetched, JSON encoding time and total
+    latency per route, sends them back in a Server-Timing header and
+    serves the aggregates on GET /metrics
+"""
+
+
+def init_instrumentation(app):
+    metrics = Metrics()
+    app.extensions["trivia_metrics"] = metrics
+
+    with app.app_context():
+        listen_to_engine(db.engine)
+    router = app.extensions.get("trivia_replicas")
+    for replica in router.replicas if router is not None else ():
+        listen_to_engine(replica.engine)
+    time_json(app.json)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_stats = {
+            "started": time.perf_counter(),
+            "queries": 0,
+            "rows": 0,
+            "db_time": 0.0,
+            "json_time": 0.0
+        }
+
+    @app.after_request
+    def record_request_metrics(response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats["started"]
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        if route != "/metrics":
+            metrics.observe((request.method, route, response.status_code),
+                            stats, total)
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats["db_time"] * 1000:.2f};'
+            f'desc="{stats["queries"]} queries, {stats["rows"]} rows", '
+            f'ser;dur={stats["json_time"] * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+        return response
+
+    @app.route("/metrics")
+    def get_metrics():
+        return app.response_class(metrics.render(),
+                                  mimetype="text/plain; version=0.0.4")
+
+    return metrics
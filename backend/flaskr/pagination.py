@@ -0,0 +1,51 @@
+from sqlalchemy import func
+
+QUESTIONS_PER_PAGE = 10
+
+
+def page_offset(request, per_page=QUESTIONS_PER_PAGE):
+    page = request.args.get("page", 1, type=int)
+    if page < 1:
+        return None
+
+    return (page - 1) * per_page
+
+
+"""
+paginate_query(request, query, key)
+    pushes pagination into SQL: the page is fetched with LIMIT/OFFSET
+    (or a keyset filter on `key` when ?after_id= is given) and the total
+    comes from a separate COUNT, so no request loads the whole table.
+    Passing `order_by` (e.g. a search rank) disables the keyset mode.
+"""
+
+
+def paginate_query(request, query, key, per_page=QUESTIONS_PER_PAGE,
+                   with_total=True, order_by=None):
+    after_id = None
+    if order_by is None:
+        after_id = request.args.get("after_id", None, type=int)
+        order_by = [key]
+
+    total = None
+    if with_total:
+        total = query.order_by(None).with_entities(func.count(key)).scalar()
+
+    if after_id is not None:
+        query = query.filter(key > after_id)
+        start = 0
+    else:
+        start = page_offset(request, per_page)
+        if start is None:
+            return [], total
+
+    selection = query.order_by(*order_by).limit(per_page).offset(start).all()
+
+    return selection, total
+
+
+def next_cursor(selection, per_page=QUESTIONS_PER_PAGE):
+    if len(selection) < per_page:
+        return None
+
+    return selection[-1].id
@@ -0,0 +1,421 @@
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from models import (
+            db,
+            MAX_DIFFICULTY,
+            MIN_DIFFICULTY,
+            Question,
+            QuestionSchema)
+from .replicas import primary_reads
+
+
+"""
+Deck
+    shuffled question ids handed out in order; once every id has been
+    dealt the deck is reshuffled in place
+"""
+
+
+class Deck:
+    __slots__ = ("ids", "position")
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        random.shuffle(self.ids)
+        self.position = 0
+
+    def pop(self):
+        if self.position >= len(self.ids):
+            random.shuffle(self.ids)
+            self.position = 0
+
+        question_id = self.ids[self.position]
+        self.position += 1
+        return question_id
+
+    def __len__(self):
+        return len(self.ids)
+
+
+DIFFICULTY_LEVELS = tuple(range(MIN_DIFFICULTY, MAX_DIFFICULTY + 1))
+
+
+"""
+target_difficulty(accuracy)
+    maps a running accuracy (0..1) onto the difficulty scale; players
+    without answers yet start in the middle
+"""
+
+
+def target_difficulty(accuracy=None):
+    lowest, highest = DIFFICULTY_LEVELS[0], DIFFICULTY_LEVELS[-1]
+    if accuracy is None:
+        return DIFFICULTY_LEVELS[len(DIFFICULTY_LEVELS) // 2]
+
+    accuracy = min(max(float(accuracy), 0.0), 1.0)
+    return lowest + round(accuracy * (highest - lowest))
+
+
+"""
+requested_difficulty(body, session)
+    difficulty asked for by a quiz turn: an explicit `difficulty`, else
+    one derived from the client's `accuracy`, else from the accuracy of
+    an adaptive session, counting the answer (`correct`) this turn
+    reports. None means any difficulty. An explicit difficulty off the
+    quiz scale raises marshmallow's ValidationError.
+"""
+
+
+def requested_difficulty(body, session=None):
+    if body.get("difficulty") is not None:
+        return QuestionSchema(only=("difficulty",)).load(
+            {"difficulty": body["difficulty"]})["difficulty"]
+    if body.get("accuracy") is not None:
+        return target_difficulty(body["accuracy"])
+    if session is not None and session.adaptive:
+        return target_difficulty(session.accuracy_with(body.get("correct")))
+
+    return None
+
+
+"""
+QuizDecks
+    precomputed quiz decks, one per category plus one for all questions,
+    and the same again per difficulty bucket, so a quiz turn only pops
+    ids and fetches a single row by primary key.
+    The first draw builds the decks. Writes are reported through
+    changed(); with start_refill() a background thread (started by that
+    first draw) rebuilds the decks from the database, otherwise
+    they are dropped and rebuilt on the next draw. Removed ids are
+    skipped right away, new ones show up after the rebuild.
+    Writes made by other processes never reach changed(): every
+    `refresh` seconds the decks are rebuilt if the shared data version
+    (`version`) has moved, or unconditionally when there is none.
+"""
+
+QUIZ_DECK_REFRESH = 60.0
+
+
+class QuizDecks:
+    max_attempts = 16
+
+    def __init__(self, refresh=QUIZ_DECK_REFRESH, version=None):
+        self.refresh = refresh
+        self._version = version
+        self._lock = threading.Lock()
+        self._decks = None
+        self._buckets = None
+        self._levels = DIFFICULTY_LEVELS
+        self._removed = set()
+        self._pending = 0
+        self._stale_since = None
+        self._built_at = None
+        self._built_version = None
+        self._checked_at = None
+        self._rebuild_seconds = None
+        self._rebuilds = 0
+        self._refill = None
+        self._refill_app = None
+        self._refill_started = False
+
+    @property
+    def built(self):
+        return self._decks is not None
+
+    def build(self, rows=None):
+        started = time.perf_counter()
+        # count the changes before loading, so a write racing the load
+        # keeps the decks marked stale
+        with self._lock:
+            covered = self._pending
+        version = None if self._version is None else self._version()
+
+        if rows is None:
+            # the decks are shared by every request, never load them from
+            # a lagging replica
+            with primary_reads():
+                rows = db.session.query(
+                    Question.id, Question.category, Question.difficulty
+                    ).filter(Question.live()).all()
+        by_category = {}
+        by_bucket = {}
+        all_ids = []
+        # rows stored before the schema capped the scale keep their own
+        # levels, so they can still be dealt
+        levels = set(DIFFICULTY_LEVELS)
+        for question_id, category_id, difficulty in rows:
+            if difficulty is not None:
+                levels.add(difficulty)
+            by_category.setdefault(category_id, []).append(question_id)
+            by_bucket.setdefault((category_id, difficulty),
+                                 []).append(question_id)
+            by_bucket.setdefault((None, difficulty), []).append(question_id)
+            all_ids.append(question_id)
+
+        decks = {category_id: Deck(ids)
+                 for category_id, ids in by_category.items()}
+        decks[None] = Deck(all_ids)
+        buckets = {key: Deck(ids) for key, ids in by_bucket.items()}
+
+        with self._lock:
+            self._decks = decks
+            self._buckets = buckets
+            self._levels = sorted(levels)
+            # ids removed while loading can still be in the new decks
+            self._removed &= set(all_ids)
+            self._pending = max(self._pending - covered, 0)
+            if self._pending == 0:
+                self._stale_since = None
+            self._built_at = self._checked_at = time.monotonic()
+            self._built_version = version
+            self._rebuild_seconds = time.perf_counter() - started
+            self._rebuilds += 1
+
+    def outdated(self):
+        # at most one check per `refresh` seconds
+        now = time.monotonic()
+        if (not self.refresh or self._checked_at is None
+                or now - self._checked_at < self.refresh):
+            return False
+
+        self._checked_at = now
+        return (self._version is None
+                or self._version() != self._built_version)
+
+    def expire_if_outdated(self):
+        # without a refill thread outdated decks are rebuilt by the next
+        # draw; call before drawing
+        if self._refill is None and self.outdated():
+            self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._decks = None
+            self._buckets = None
+            self._removed.clear()
+            self._pending = 0
+            self._stale_since = None
+
+    def changed(self, removed_id=None, removed_ids=()):
+        if self._refill is None:
+            self.invalidate()
+            return
+
+        with self._lock:
+            if removed_id is not None:
+                self._removed.add(removed_id)
+            self._removed.update(removed_ids)
+            self._pending += 1
+            if self._stale_since is None:
+                self._stale_since = time.monotonic()
+        self._refill.set()
+
+    def start_refill(self, app):
+        # the thread only starts with the first draw, so building the app
+        # (e.g. for `flask db upgrade`) never queries the database
+        self._refill = threading.Event()
+        self._refill_app = app
+
+    def _start_refill_thread(self):
+        with self._lock:
+            if self._refill_started:
+                return
+            self._refill_started = True
+        refill, app = self._refill, self._refill_app
+
+        def run():
+            while True:
+                changed = refill.wait(self.refresh or None)
+                refill.clear()
+                try:
+                    if changed or self.outdated():
+                        with app.app_context():
+                            self.build()
+                except Exception:
+                    app.logger.exception("quiz deck rebuild failed")
+
+        threading.Thread(target=run, name="quiz-deck-refill",
+                         daemon=True).start()
+
+    def draw(self, category_id=None, seen=frozenset(), difficulty=None):
+        decks, buckets = self._decks, self._buckets
+        if decks is None:
+            self.build()
+            decks, buckets = self._decks, self._buckets
+            if self._refill is not None:
+                self._start_refill_thread()
+
+        if difficulty is None:
+            return self._deal(decks.get(category_id), seen)
+
+        # the requested bucket first, then the nearest difficulties
+        for level in sorted(self._levels,
+                            key=lambda level: (abs(level - difficulty),
+                                               level)):
+            question_id = self._deal(buckets.get((category_id, level)), seen)
+            if question_id is not None:
+                return question_id
+
+        return None
+
+    def _deal(self, deck, seen):
+        if deck is None or len(deck) == 0:
+            return None
+
+        with self._lock:
+            for _ in range(self.max_attempts):
+                candidate = deck.pop()
+                if candidate not in seen and candidate not in self._removed:
+                    return candidate
+
+            remaining = [question_id for question_id in deck.ids
+                         if question_id not in seen
+                         and question_id not in self._removed]
+
+        if len(remaining) == 0:
+            return None
+
+        return random.choice(remaining)
+
+    def stats(self):
+        now = time.monotonic()
+
+        with self._lock:
+            decks = self._decks or {}
+            buckets = self._buckets or {}
+            return {
+                "decks": {
+                    "all" if category_id is None else str(category_id):
+                        len(deck)
+                    for category_id, deck in decks.items()
+                    },
+                "buckets": {
+                    f"{'all' if category_id is None else category_id}:"
+                    f"{difficulty}": len(deck)
+                    for (category_id, difficulty), deck in buckets.items()
+                    },
+                "background_refill": self._refill is not None,
+                "rebuilds": self._rebuilds,
+                "rebuild_ms": None if self._rebuild_seconds is None
+                else round(self._rebuild_seconds * 1000, 3),
+                "built_seconds_ago": None if self._built_at is None
+                else round(now - self._built_at, 3),
+                "pending_changes": self._pending,
+                "stale_seconds": None if self._stale_since is None
+                else round(now - self._stale_since, 3)
+            }
+
+
+"""
+SeenSet
+    sparse bitmap of question ids, one 64 bit word per occupied block
+"""
+
+
+class SeenSet:
+    __slots__ = ("_words", "_count")
+
+    def __init__(self):
+        self._words = {}
+        self._count = 0
+
+    def add(self, question_id):
+        word, bit = divmod(question_id, 64)
+        bits = self._words.get(word, 0)
+        if not bits >> bit & 1:
+            self._words[word] = bits | 1 << bit
+            self._count += 1
+
+    def __contains__(self, question_id):
+        word, bit = divmod(question_id, 64)
+        return bool(self._words.get(word, 0) >> bit & 1)
+
+    def __len__(self):
+        return self._count
+
+
+class QuizSession:
+    __slots__ = ("category_id", "seen", "expires_at", "adaptive",
+                 "answered", "correct")
+
+    def __init__(self, category_id, expires_at, adaptive=False):
+        self.category_id = category_id
+        self.seen = SeenSet()
+        self.expires_at = expires_at
+        self.adaptive = adaptive
+        self.answered = 0
+        self.correct = 0
+
+    def record(self, correct):
+        self.answered += 1
+        self.correct += bool(correct)
+
+    @property
+    def accuracy(self):
+        return self.accuracy_with()
+
+    def accuracy_with(self, correct=None):
+        # the accuracy once `correct` is recorded, without recording it
+        answered = self.answered + (correct is not None)
+        if answered == 0:
+            return None
+
+        return (self.correct + bool(correct)) / answered
+
+
+"""
+QuizSessionStore
+    process-local quiz sessions keyed by an opaque token; sessions are
+    kept in last-use order so expired ones are evicted from the front.
+    Another worker doesn't know the token, so clients behind several
+    workers also send their previous questions as a fallback.
+"""
+
+
+class QuizSessionStore:
+
+    def __init__(self, ttl=1800, max_sessions=100000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, category_id, adaptive=False):
+        token = secrets.token_urlsafe(16)
+
+        with self._lock:
+            self._evict(time.monotonic(), reserve=1)
+            self._sessions[token] = QuizSession(
+                category_id, time.monotonic() + self.ttl, adaptive
+                )
+
+        return token
+
+    def get(self, token):
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(token)
+
+        return session
+
+    def _evict(self, now, reserve=0):
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if (session.expires_at > now
+                    and len(self._sessions) + reserve <= self.max_sessions):
+                break
+            del self._sessions[token]
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,253 @@
+import contextlib
+import functools
+import itertools
+import threading
+
+from flask import current_app, g, request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from models import (
+            config_setting,
+            db,
+            engine_options,
+            local_statement_timeout,
+            set_local_statement_timeout)
+
+REPLICA_HEALTH_INTERVAL = 5
+READ_AFTER_WRITE = 5
+PRIMARY_COOKIE = "trivia_primary"
+
+
+def replica_urls(config):
+    urls = config_setting(config, "DATABASE_REPLICA_URLS", "")
+    if isinstance(urls, str):
+        urls = urls.split(",")
+
+    return [url.strip() for url in urls if url.strip()]
+
+
+class Replica:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.reads = 0
+        self.failures = 0
+
+
+"""
+ReplicaRouter
+    round-robin over the healthy read replicas. A replica is taken out
+    when a query on it fails to connect and put back by the periodic
+    health check; with none left, reads fall back to the primary.
+"""
+
+
+class ReplicaRouter:
+
+    def __init__(self, urls, config):
+        self.replicas = []
+        statement_timeout = local_statement_timeout(config)
+        for url in urls:
+            engine = create_engine(url, **engine_options(config, url))
+            set_local_statement_timeout(engine, statement_timeout)
+            replica = Replica(engine)
+            event.listen(engine, "handle_error",
+                         functools.partial(self._handle_error, replica))
+            self.replicas.append(replica)
+        self.window = config_setting(config, "REPLICA_READ_AFTER_WRITE",
+                                     READ_AFTER_WRITE)
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._counts = {"primary_reads": 0, "pinned_reads": 0,
+                        "failovers": 0}
+
+    def route(self, request):
+        # clients that wrote within the window read their own writes
+        if self.window and request.cookies.get(PRIMARY_COOKIE):
+            self._count("pinned_reads")
+            return None
+
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if len(healthy) == 0:
+            self._count("primary_reads")
+            return None
+
+        replica = healthy[next(self._turn) % len(healthy)]
+        with self._lock:
+            replica.reads += 1
+
+        return replica
+
+    def replica_of(self, engine):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                return replica
+
+        return None
+
+    def mark_down(self, replica, error=None):
+        with self._lock:
+            was_healthy = replica.healthy
+            replica.healthy = False
+            replica.failures += 1
+            self._counts["failovers"] += 1
+        if was_healthy:
+            current_app.logger.warning("read replica %s is down: %s",
+                                       replica.engine.url, error)
+
+    def _handle_error(self, replica, context):
+        if context.is_disconnect:
+            replica.healthy = False
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+            except DBAPIError:
+                replica.healthy = False
+            else:
+                replica.healthy = True
+
+    def start_health_checks(self, app, interval):
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.check()
+                except Exception:
+                    app.logger.exception("read replica health check failed")
+
+        threading.Thread(target=run, name="replica-health", daemon=True
+                         ).start()
+
+        return stop
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counts,
+                "replicas": [{"url": replica.engine.url.render_as_string(
+                                  hide_password=True),
+                              "healthy": replica.healthy,
+                              "reads": replica.reads,
+                              "failures": replica.failures}
+                             for replica in self.replicas]
+            }
+
+
+"""
+replica_reads(view)
+    runs a read-only view with its SELECTs on a read replica (see
+    models.RoutingSession). When the replica can't be reached, it is
+    marked down and the view runs again on the primary.
+"""
+
+
+def replica_reads(view):
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get("trivia_replicas")
+        replica = None if router is None else router.route(request)
+        if replica is None:
+            return view(*args, **kwargs)
+
+        g.db_replica = replica.engine
+        try:
+            return view(*args, **kwargs)
+        except DBAPIError as error:
+            if not fail_over(error):
+                raise
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+"""
+fail_over(error)
+    after a replica connection failure, marks the request's replica down
+    and sends its remaining reads to the primary. Returns False, doing
+    nothing, for any other error or outside a replica read.
+"""
+
+
+def fail_over(error):
+    router = current_app.extensions.get("trivia_replicas")
+    engine = g.get("db_replica")
+    if router is None or engine is None:
+        return False
+    if not (isinstance(error, OperationalError)
+            or error.connection_invalidated):
+        return False
+
+    router.mark_down(router.replica_of(engine), error)
+    db.session.rollback()
+    del g.db_replica
+    return True
+
+
+"""
+streamed_reads(rows, resume)
+    yields `rows` for a body that streams after replica_reads has
+    returned. When the replica fails midway, it is marked down and
+    `resume(last)` carries on from the primary after the last row
+    yielded (None when there was none).
+"""
+
+
+def streamed_reads(rows, resume):
+    last = None
+    try:
+        for row in rows:
+            yield row
+            last = row
+    except DBAPIError as error:
+        if not fail_over(error):
+            raise
+
+        yield from resume(last)
+
+
+"""
+primary_reads()
+    runs the enclosed queries on the primary even inside replica_reads,
+    for reads that must not see a lagging replica
+"""
+
+
+@contextlib.contextmanager
+def primary_reads():
+    replica = g.pop("db_replica", None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.db_replica = replica
+
+
+def init_replicas(app, urls):
+    router = ReplicaRouter(urls, app.config)
+    app.extensions["trivia_replicas"] = router
+
+    interval = config_setting(app.config, "REPLICA_HEALTH_INTERVAL",
+                              REPLICA_HEALTH_INTERVAL)
+    if interval:
+        router.start_health_checks(app, interval)
+
+    @app.after_request
+    def pin_writer(response):
+        if g.get("db_wrote") and router.window:
+            response.set_cookie(PRIMARY_COOKIE, "1", max_age=router.window,
+                                httponly=True, samesite="Lax")
+        return response
+
+    return router
@@ -0,0 +1,249 @@
+import atexit
+import bisect
+import datetime
+import threading
+import time
+
+from sqlalchemy import case, func
+
+from models import config_setting, db, QuizAnswer
+
+RESULTS_BATCH_SIZE = 500
+RESULTS_FLUSH_INTERVAL = 1.0
+RESULTS_MAX_PENDING = 100000
+LEADERBOARD_SIZE = 10
+LEADERBOARD_REFRESH = 60.0
+
+
+"""
+TopN
+    one leaderboard: every player's correct/answered counts plus the
+    sorted top-N keys. Scores only grow, so an answer moves at most one
+    player up and the top list is kept with a bisect insert.
+"""
+
+
+class TopN:
+
+    def __init__(self, size):
+        self.size = size
+        self.scores = {}
+        self.top = []
+
+    def add(self, player, correct, answered=1):
+        score = self.scores.setdefault(player, [0, 0])
+        old_key = (-score[0], player)
+        score[0] += correct
+        score[1] += answered
+        if correct == 0:
+            return
+
+        key = (-score[0], player)
+        position = bisect.bisect_left(self.top, old_key)
+        if position < len(self.top) and self.top[position] == old_key:
+            del self.top[position]
+        elif len(self.top) >= self.size and key >= self.top[-1]:
+            return
+
+        bisect.insort(self.top, key)
+        del self.top[self.size:]
+
+    def leaders(self, limit):
+        return [{"player": player,
+                 "score": -score,
+                 "answered": self.scores[player][1]}
+                for score, player in self.top[:limit]]
+
+
+class Leaderboard:
+
+    def __init__(self, size=LEADERBOARD_SIZE):
+        self.size = size
+        self.boards = {}
+
+    def add(self, category_id, player, correct, answered=1):
+        # every answer counts on its category board and on the overall one
+        keys = {category_id, None}
+        for key in keys:
+            board = self.boards.get(key)
+            if board is None:
+                board = self.boards[key] = TopN(self.size)
+            board.add(player, correct, answered)
+
+    def leaders(self, category_id=None, limit=LEADERBOARD_SIZE):
+        board = self.boards.get(category_id)
+        if board is None:
+            return []
+
+        return board.leaders(limit)
+
+
+def load_leaderboard(size=LEADERBOARD_SIZE):
+    leaderboard = Leaderboard(size)
+    rows = db.session.query(
+        QuizAnswer.category,
+        QuizAnswer.player,
+        func.sum(case((QuizAnswer.correct, 1), else_=0)),
+        func.count(QuizAnswer.id)
+        ).group_by(QuizAnswer.category, QuizAnswer.player)
+    for category_id, player, correct, answered in rows:
+        leaderboard.add(category_id, player, int(correct or 0), answered)
+
+    return leaderboard
+
+
+"""
+ResultRecorder
+    accepts quiz answers without touching the database: they are applied
+    to the in-memory leaderboard at once and written by a background
+    thread in executemany batches, every RESULTS_FLUSH_INTERVAL seconds
+    or as soon as RESULTS_BATCH_SIZE answers are waiting.
+
+    Durability: an accepted answer lives only in memory until the next
+    flush. close() (registered with atexit, so it runs on a clean worker
+    shutdown) flushes what is left; a crash loses at most one interval.
+    A failed flush keeps its answers for the next attempt, dropping the
+    oldest (and counting them) beyond RESULTS_MAX_PENDING.
+"""
+
+
+class ResultRecorder:
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = config_setting(app.config, "RESULTS_BATCH_SIZE",
+                                         RESULTS_BATCH_SIZE)
+        self.interval = config_setting(app.config, "RESULTS_FLUSH_INTERVAL",
+                                       RESULTS_FLUSH_INTERVAL)
+        self.max_pending = config_setting(app.config, "RESULTS_MAX_PENDING",
+                                          RESULTS_MAX_PENDING)
+        self.board_size = config_setting(app.config, "LEADERBOARD_SIZE",
+                                         LEADERBOARD_SIZE)
+        self.refresh = config_setting(app.config, "LEADERBOARD_REFRESH",
+                                      LEADERBOARD_REFRESH)
+        # _lock guards the pending answers and the leaderboard together,
+        # _flush_lock serializes writers and leaderboard reloads
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._leaderboard = None
+        self._loaded_at = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counts = {"recorded": 0, "flushed": 0, "batches": 0,
+                        "failed_flushes": 0, "dropped": 0}
+
+    def record(self, player, question_id, correct, category_id=None):
+        if self._leaderboard is None:
+            self.reload()
+        self._start()
+
+        answer = {
+            "player": player,
+            "question": question_id,
+            "correct": bool(correct),
+            "category": category_id,
+            "answered_at": datetime.datetime.utcnow()
+        }
+        with self._lock:
+            self._pending.append(answer)
+            self._leaderboard.add(category_id, player, int(bool(correct)))
+            self._counts["recorded"] += 1
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self._counts["dropped"] += overflow
+            full = len(self._pending) >= self.batch_size
+
+        if full:
+            self._wake.set()
+
+    def leaders(self, category_id=None, limit=LEADERBOARD_SIZE):
+        if self._leaderboard is None:
+            self.reload()
+
+        with self._lock:
+            return self._leaderboard.leaders(category_id, limit)
+
+    def reload(self):
+        # rebuilt from the stored answers plus the ones still waiting;
+        # holding _flush_lock keeps a batch from moving in between
+        with self._flush_lock:
+            leaderboard = load_leaderboard(self.board_size)
+            with self._lock:
+                for answer in self._pending:
+                    leaderboard.add(answer["category"], answer["player"],
+                                    int(answer["correct"]))
+                self._leaderboard = leaderboard
+                self._loaded_at = time.monotonic()
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                    dropped = self._counts["dropped"]
+                if len(batch) == 0:
+                    return
+
+                try:
+                    db.session.execute(QuizAnswer.__table__.insert(), batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    with self._lock:
+                        self._counts["failed_flushes"] += 1
+                    raise
+
+                with self._lock:
+                    # answers are only appended at the end and dropped
+                    # from the front, so whatever overflow did not trim
+                    # of the batch is still the head of the list
+                    trimmed = self._counts["dropped"] - dropped
+                    del self._pending[:max(len(batch) - trimmed, 0)]
+                    self._counts["flushed"] += len(batch)
+                    self._counts["batches"] += 1
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name="quiz-result-writer",
+                                            daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    if (self.refresh and time.monotonic() - self._loaded_at
+                            >= self.refresh):
+                        self.reload()
+            except Exception:
+                self.app.logger.exception("writing quiz answers failed")
+
+    def close(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            self.app.logger.exception("writing quiz answers failed")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "pending": len(self._pending)}
@@ -0,0 +1,275 @@
+import bisect
+import re
+import threading
+import time
+
+from sqlalchemy import func, inspect, literal_column
+
+from models import db, Question
+from .pagination import QUESTIONS_PER_PAGE, paginate_query, page_offset
+from .serialization import question_rows
+
+TOKEN_PATTERN = re.compile(r"\w+")
+SEARCH_CONFIG = "english"
+SEARCH_INDEX_REFRESH = 60.0
+# matched ids per COUNT statement, below the SQLite variable limit
+COUNT_BATCH_SIZE = 10000
+
+
+def tokenize(text):
+    if not text:
+        return []
+
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+"""
+InvertedIndex
+    pure-Python token -> question ids index used when the database has no
+    full-text support (SQLite, or Postgres before the search migration).
+    Every search term is matched as a token prefix, like the tsquery
+    built for Postgres.
+
+    Writes made by other workers or the CLI are picked up by a rebuild,
+    checked at most every `refresh` seconds: when the shared data version
+    (`version`) has moved, or unconditionally when there is none.
+"""
+
+
+class InvertedIndex:
+
+    def __init__(self, refresh=SEARCH_INDEX_REFRESH, version=None):
+        self.refresh = refresh
+        self._version = version
+        self._lock = threading.Lock()
+        self._postings = None
+        self._tokens = None
+        self._documents = None
+        self._built_version = None
+        self._checked_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+            self._tokens = None
+            self._documents = None
+
+    @property
+    def built(self):
+        return self._postings is not None
+
+    def build(self, rows=None):
+        # read the version before loading so a write racing the load
+        # leaves the index outdated rather than wrongly current
+        version = None if self._version is None else self._version()
+        postings = {}
+        documents = {}
+
+        if rows is None:
+            rows = db.session.query(
+                Question.id, Question.question
+                ).filter(Question.live()).all()
+        for question_id, text in rows:
+            tokens = set(tokenize(text))
+            documents[question_id] = tokens
+            for token in tokens:
+                postings.setdefault(token, set()).add(question_id)
+
+        with self._lock:
+            self._postings = postings
+            self._tokens = sorted(postings)
+            self._documents = documents
+            self._built_version = version
+            self._checked_at = time.monotonic()
+
+    def outdated(self):
+        # at most one check per `refresh` seconds
+        now = time.monotonic()
+        if (not self.refresh or self._checked_at is None
+                or now - self._checked_at < self.refresh):
+            return False
+
+        self._checked_at = now
+        return (self._version is None
+                or self._version() != self._built_version)
+
+    def expire_if_outdated(self):
+        # outdated postings are rebuilt by the next search; call before
+        # searching
+        if self.outdated():
+            self.invalidate()
+
+    def add(self, question_id, text):
+        with self._lock:
+            if self._postings is None:
+                return
+
+            tokens = set(tokenize(text))
+            self._documents[question_id] = tokens
+            for token in tokens:
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    bisect.insort(self._tokens, token)
+                self._postings[token].add(question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._postings is None:
+                return
+
+            for token in self._documents.pop(question_id, ()):
+                ids = self._postings[token]
+                ids.discard(question_id)
+                if len(ids) == 0:
+                    del self._postings[token]
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _prefix_matches(self, prefix):
+        ids = set()
+        start = bisect.bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids |= self._postings[token]
+
+        return ids
+
+    def search(self, term):
+        if self._postings is None:
+            self.build()
+
+        terms = tokenize(term)
+        if len(terms) == 0:
+            return []
+
+        with self._lock:
+            matches = None
+            for prefix in terms:
+                ids = self._prefix_matches(prefix)
+                matches = ids if matches is None else matches & ids
+                if len(matches) == 0:
+                    return []
+
+            # rank whole-word hits above prefix-only hits, then by id
+            scores = {question_id: 0 for question_id in matches}
+            for token in terms:
+                for question_id in self._postings.get(token, ()):
+                    if question_id in scores:
+                        scores[question_id] += 1
+
+        return sorted(matches, key=lambda i: (-scores[i], i))
+
+
+def fulltext_available(bind):
+    return (
+        bind.dialect.name == "postgresql"
+        and "search_vector" in {
+            column["name"]
+            for column in inspect(bind).get_columns("questions")
+            }
+        )
+
+
+def fulltext_clauses(term):
+    vector = literal_column("questions.search_vector")
+    query = func.to_tsquery(
+        SEARCH_CONFIG,
+        " & ".join(f"{token}:*" for token in tokenize(term))
+        )
+
+    return vector.op("@@")(query), func.ts_rank(vector, query)
+
+
+"""
+QuestionSearch
+    searches question text with the Postgres `search_vector` column and its
+    GIN index when the migration has been applied, and with the in-memory
+    InvertedIndex otherwise. Results are ranked and paginated.
+"""
+
+
+class QuestionSearch:
+
+    def __init__(self, refresh=SEARCH_INDEX_REFRESH, version=None):
+        self.index = InvertedIndex(refresh, version)
+        self._fulltext = None
+
+    def uses_fulltext(self, bind=None):
+        if self._fulltext is None:
+            self._fulltext = fulltext_available(bind or db.engine)
+
+        return self._fulltext
+
+    def invalidate(self):
+        self.index.invalidate()
+
+    def add(self, question):
+        self.index.add(question.id, question.question)
+
+    def remove(self, question_id):
+        self.index.remove(question_id)
+
+    def search(self, request, term, per_page=QUESTIONS_PER_PAGE):
+        if len(tokenize(term)) == 0:
+            return paginate_query(request, question_rows(),
+                                  Question.id, per_page=per_page)
+
+        if self.uses_fulltext():
+            return self._search_fulltext(request, term, per_page)
+
+        return self._search_index(request, term, per_page)
+
+    def _search_fulltext(self, request, term, per_page):
+        match, rank = fulltext_clauses(term)
+
+        return paginate_query(
+            request,
+            question_rows().filter(match),
+            Question.id,
+            per_page=per_page,
+            order_by=[rank.desc(), Question.id]
+            )
+
+    def _search_index(self, request, term, per_page):
+        self.index.expire_if_outdated()
+        ids = self.index.search(term)
+        if len(ids) == 0:
+            return [], 0
+
+        # the postings can still hold rows deleted by another worker, so
+        # the total counts the live ones
+        total = sum(
+            db.session.query(func.count(Question.id)).filter(
+                Question.id.in_(batch), Question.live()
+                ).scalar()
+            for batch in count_batches(ids)
+            )
+
+        start = page_offset(request, per_page)
+        if start is None:
+            return [], total
+
+        page_ids = ids[start:start + per_page]
+        if len(page_ids) == 0:
+            return [], total
+
+        rows = {
+            row.id: row
+            for row in question_rows().filter(
+                Question.id.in_(page_ids)
+                ).all()
+            }
+        self.drop_missing(page_ids, rows)
+        selection = [rows[i] for i in page_ids if i in rows]
+
+        return selection, total
+
+    def drop_missing(self, page_ids, rows):
+        for question_id in page_ids:
+            if question_id not in rows:
+                self.index.remove(question_id)
+
+
+def count_batches(ids):
+    for start in range(0, len(ids), COUNT_BATCH_SIZE):
+        yield ids[start:start + COUNT_BATCH_SIZE]
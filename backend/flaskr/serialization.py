@@ -0,0 +1,70 @@
+from flask.json.provider import DefaultJSONProvider, _default
+
+from models import config_setting, db, Question, Category
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+QUESTION_FIELDS = ("id", "question", "answer", "category", "difficulty")
+
+
+"""
+question_rows()
+    lean read path for listings: selects the live question columns plus
+    the category name (one outer join) as plain row tuples, skipping ORM
+    hydration and the identity map
+"""
+
+
+def question_columns():
+    return [
+        *[getattr(Question, field) for field in QUESTION_FIELDS],
+        Category.type.label("category_type")
+        ]
+
+
+def question_rows():
+    return db.session.query(*question_columns()).outerjoin(
+        Category, Question.category == Category.id
+        ).filter(Question.live())
+
+
+def format_question_row(row, fields=None):
+    if fields is not None:
+        return {field: getattr(row, field) for field in fields}
+
+    return {
+        'id': row.id,
+        'question': row.question,
+        'answer': row.answer,
+        'category': row.category,
+        'difficulty': row.difficulty
+        }
+
+
+"""
+OrjsonProvider
+    drop-in JSON provider backed by orjson; non-string keys (the category
+    map) are allowed and anything orjson can't encode falls back to Flask's
+    default handling
+"""
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_json_provider(app):
+    name = config_setting(app.config, "JSON_PROVIDER", "auto")
+    if name == "orjson" or (name == "auto" and orjson is not None):
+        if orjson is None:
+            raise RuntimeError("JSON_PROVIDER=orjson needs the orjson package")
+        app.json = OrjsonProvider(app)
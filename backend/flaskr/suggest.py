@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import sys
+import threading
+import time
+
+from models import db, Question
+from .search import tokenize
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+SUGGEST_MAX_TERMS = 200000
+SUGGEST_REFRESH = 60.0
+MIN_TERM_LENGTH = 2
+# prefixes matching more terms than this keep their top-k in a cache
+CACHED_RANGE = 256
+CACHE_SIZE = 10000
+
+
+def suggestible(token):
+    return len(token) >= MIN_TERM_LENGTH and not token.isdigit()
+
+
+"""
+PrefixSuggester
+    question-text vocabulary for search-as-you-type: a sorted array of
+    terms searched with bisect, plus each term's document frequency. A
+    prefix maps to one contiguous slice of the array; its most frequent
+    terms are picked with a heap, and cached when the slice is large.
+
+    Memory is bounded by SUGGEST_MAX_TERMS: a rebuild keeps the most
+    frequent terms, and new terms beyond the cap are ignored until the
+    next rebuild. Inserted questions are added at once. Deleted ones are
+    queued and subtracted on the next lookup, reading their text from
+    the tombstones.
+
+    Writes made by other workers or the CLI are picked up by a rebuild,
+    checked at most every `refresh` seconds: when the shared data version
+    (`version`) has moved, or unconditionally when there is none.
+"""
+
+
+class PrefixSuggester:
+
+    def __init__(self, max_terms=SUGGEST_MAX_TERMS, refresh=SUGGEST_REFRESH,
+                 version=None):
+        self.max_terms = max_terms
+        self.refresh = refresh
+        self._version = version
+        self._built_version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._terms = None
+        self._counts = None
+        self._cache = {}
+        self._removed = []
+        self._skipped = 0
+
+    @property
+    def built(self):
+        return self._terms is not None
+
+    def invalidate(self):
+        with self._lock:
+            self._terms = None
+            self._counts = None
+            self._cache = {}
+            self._removed = []
+
+    def build(self, texts=None):
+        # read the version before loading so a write racing the load
+        # leaves the vocabulary outdated rather than wrongly current
+        version = None if self._version is None else self._version()
+        if texts is None:
+            texts = (text for text, in db.session.query(
+                Question.question
+                ).filter(Question.live()).yield_per(10000))
+
+        counts = {}
+        for text in texts:
+            for token in set(tokenize(text)):
+                if suggestible(token):
+                    counts[token] = counts.get(token, 0) + 1
+
+        skipped = 0
+        if len(counts) > self.max_terms:
+            kept = heapq.nlargest(self.max_terms, counts.items(),
+                                  key=lambda item: item[1])
+            skipped = len(counts) - self.max_terms
+            counts = dict(kept)
+
+        with self._lock:
+            self._terms = sorted(counts)
+            self._counts = counts
+            self._cache = {}
+            self._removed = []
+            self._skipped = skipped
+            self._built_version = version
+            self._checked_at = time.monotonic()
+
+    def outdated(self):
+        # at most one check per `refresh` seconds
+        now = time.monotonic()
+        if (not self.refresh or self._checked_at is None
+                or now - self._checked_at < self.refresh):
+            return False
+
+        self._checked_at = now
+        return (self._version is None
+                or self._version() != self._built_version)
+
+    def add(self, text):
+        with self._lock:
+            if self._terms is None:
+                return
+
+            for token in set(tokenize(text)):
+                if not suggestible(token):
+                    continue
+                if token not in self._counts:
+                    if len(self._terms) >= self.max_terms:
+                        self._skipped += 1
+                        continue
+                    bisect.insort(self._terms, token)
+                    self._counts[token] = 0
+                self._counts[token] += 1
+                self._forget(token)
+
+    def removed(self, question_ids):
+        with self._lock:
+            if self._terms is not None:
+                self._removed.extend(question_ids)
+
+    def _subtract(self, text):
+        for token in set(tokenize(text)):
+            count = self._counts.get(token)
+            if count is None:
+                continue
+            if count > 1:
+                self._counts[token] = count - 1
+            else:
+                del self._counts[token]
+                del self._terms[bisect.bisect_left(self._terms, token)]
+            self._forget(token)
+
+    def _forget(self, token):
+        # drop the cached top-k of every prefix of the changed term
+        for end in range(1, len(token) + 1):
+            self._cache.pop(token[:end], None)
+
+    def _apply_removals(self):
+        with self._lock:
+            ids, self._removed = self._removed, []
+        if len(ids) == 0:
+            return
+
+        texts = [text for text, in db.session.query(
+            Question.question
+            ).filter(Question.id.in_(ids))]
+        if len(texts) < len(ids):
+            # purged before we got to them, start over
+            self.build()
+            return
+
+        with self._lock:
+            for text in texts:
+                self._subtract(text)
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        if self._terms is None or self.outdated():
+            self.build()
+        if self._removed:
+            self._apply_removals()
+
+        prefix = prefix.casefold()
+        with self._lock:
+            cached = self._cache.get(prefix)
+            if cached is not None and len(cached) >= limit:
+                return cached[:limit]
+
+            start = bisect.bisect_left(self._terms, prefix)
+            end = bisect.bisect_left(self._terms, prefix + "\U0010ffff",
+                                     start)
+            top = heapq.nsmallest(
+                max(limit, SUGGEST_LIMIT) if end - start > CACHED_RANGE
+                else limit,
+                ((-self._counts[term], term)
+                 for term in self._terms[start:end]))
+            top = [(term, -count) for count, term in top]
+
+            if end - start > CACHED_RANGE:
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[prefix] = top
+
+        return top[:limit]
+
+    def stats(self):
+        with self._lock:
+            if self._terms is None:
+                return {"built": False}
+
+            # the strings are shared by the array and the dict; small
+            # counts are shared ints, so this is an upper bound
+            memory = (sys.getsizeof(self._terms)
+                      + sys.getsizeof(self._counts)
+                      + sum(sys.getsizeof(term) for term in self._terms)
+                      + sum(sys.getsizeof(count)
+                            for count in self._counts.values())
+                      + sys.getsizeof(self._cache)
+                      + sum(sys.getsizeof(top)
+                            for top in self._cache.values()))
+            return {
+                "built": True,
+                "terms": len(self._terms),
+                "max_terms": self.max_terms,
+                "skipped_terms": self._skipped,
+                "cached_prefixes": len(self._cache),
+                "pending_removals": len(self._removed),
+                "memory_bytes": memory
+            }
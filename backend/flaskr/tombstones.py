@@ -0,0 +1,135 @@
+import datetime
+import threading
+
+from models import (
+            bump_data_version,
+            config_setting,
+            db,
+            soft_delete,
+            Question)
+
+PURGE_INTERVAL = 300
+PURGE_AFTER = 3600
+PURGE_BATCH_SIZE = 1000
+MAX_BULK_DELETE = 1000
+
+
+"""
+delete_questions(ids)
+    soft deletes the live questions among `ids` with one UPDATE and
+    returns the ids it turned into tombstones. Only when some ids were
+    already gone or never existed does a second statement find out which
+    ones, by the deleted_at stamp this call wrote.
+"""
+
+
+def delete_questions(ids):
+    ids = sorted(set(ids))
+    stamp = datetime.datetime.utcnow()
+
+    result = db.session.execute(soft_delete(ids, stamp))
+    if result.rowcount == len(ids):
+        deleted = ids
+    else:
+        deleted = [question_id for question_id, in db.session.query(
+            Question.id
+            ).filter(
+                Question.id.in_(ids),
+                Question.deleted_at == stamp
+            ).order_by(Question.id)]
+    db.session.commit()
+
+    if len(deleted) > 0:
+        bump_data_version()
+
+    return deleted
+
+
+"""
+purge_questions(older_than, batch_size)
+    hard deletes tombstones older than `older_than` seconds, one batch
+    per transaction so no statement holds locks on the whole set.
+    Returns the number of rows removed.
+"""
+
+
+def purge_questions(older_than=PURGE_AFTER, batch_size=PURGE_BATCH_SIZE):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=older_than)
+    purged = 0
+
+    while True:
+        # served by the partial ix_questions_deleted_at index
+        ids = [question_id for question_id, in db.session.query(
+            Question.id
+            ).filter(
+                Question.deleted_at < cutoff
+            ).order_by(Question.deleted_at).limit(batch_size)]
+        if len(ids) == 0:
+            break
+
+        db.session.query(Question).filter(
+            Question.id.in_(ids)
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        purged += len(ids)
+
+        if len(ids) < batch_size:
+            break
+
+    return purged
+
+
+"""
+start_purge(app, interval)
+    runs purge_questions() every `interval` seconds in a daemon thread.
+    The thread starts with the app's first request, so CLI commands such
+    as `flask db upgrade` never run one.
+"""
+
+
+def start_purge(app, interval):
+    older_than = config_setting(app.config, "QUESTION_PURGE_AFTER",
+                                PURGE_AFTER)
+    batch_size = config_setting(app.config, "QUESTION_PURGE_BATCH_SIZE",
+                                PURGE_BATCH_SIZE)
+    stop = threading.Event()
+    lock = threading.Lock()
+    thread = None
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                with app.app_context():
+                    purged = purge_questions(older_than, batch_size)
+                if purged > 0:
+                    app.logger.info("purged %d deleted question(s)", purged)
+            except Exception:
+                app.logger.exception("purging deleted questions failed")
+
+    @app.before_request
+    def start_thread():
+        nonlocal thread
+        if thread is not None:
+            return
+
+        with lock:
+            if thread is None:
+                thread = threading.Thread(target=run, name="question-purge",
+                                          daemon=True)
+                thread.start()
+
+    return stop
+
+
+def parse_question_ids(value):
+    # "1,2,3" -> [1, 2, 3]; None when empty, malformed or too long
+    try:
+        ids = [int(part) for part in (value or "").split(",") if part]
+    except ValueError:
+        return None
+
+    if len(ids) == 0 or len(ids) > MAX_BULK_DELETE:
+        return None
+
+    return ids
@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+
+RATE_LIMIT_RATE = 5.0
+RATE_LIMIT_BURST = 20
+MAX_CLIENTS = 100000
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+"""
+SingleFlight
+    concurrent calls with the same key share one computation: the first
+    caller (the leader) runs it, the others wait and get its result. A
+    failed computation is not shared, every waiter then runs its own.
+"""
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._waiting = 0
+        self._counts = {"leaders": 0, "shared": 0, "retried": 0}
+
+    def do(self, key, compute):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self._counts["leaders"] += 1
+            else:
+                self._waiting += 1
+
+        if not leader:
+            flight.done.wait()
+            with self._lock:
+                self._waiting -= 1
+                self._counts["retried" if flight.failed else "shared"] += 1
+            if flight.failed:
+                return compute()
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "in_flight": len(self._flights),
+                    "waiting": self._waiting}
+
+
+"""
+TokenBucketLimiter
+    one bucket per client key holding up to `burst` tokens, refilled at
+    `rate` tokens per second. Buckets live in this worker's memory, so
+    with N workers a client gets up to N times the rate.
+"""
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST,
+                 max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._pruned_at = 0
+        self._counts = {"allowed": 0, "limited": 0}
+
+    def acquire(self, key):
+        """Takes one token; returns 0, or the seconds until one is free."""
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                self._counts["allowed"] += 1
+                if len(self._buckets) > self.max_clients:
+                    self._prune(now)
+                return 0
+
+            self._buckets[key] = (tokens, now)
+            self._counts["limited"] += 1
+
+        return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # a bucket that has refilled completely is the same as no bucket;
+        # with more active clients than max_clients, prune once per refill
+        full = self.burst / self.rate
+        if now - self._pruned_at < full:
+            return
+
+        self._pruned_at = now
+        self._buckets = {key: bucket
+                         for key, bucket in self._buckets.items()
+                         if now - bucket[1] < full}
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "clients": len(self._buckets),
+                    "rate": self.rate, "burst": self.burst}
+
+
+def retry_after(seconds):
+    return max(1, math.ceil(seconds))
@@ -0,0 +1,54 @@
+"""question category foreign key
+
+Revision ID: 0087b76c2f6f
+Revises: bee928998e5e
+Create Date: 2026-10-18 10:03:27.551940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0087b76c2f6f'
+down_revision = 'bee928998e5e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # trivia.psql already ships a constraint named "category" and
+    # db.create_all() may have built the index; only add what is missing
+    inspector = sa.inspect(op.get_bind())
+    has_foreign_key = any(
+        fk['referred_table'] == 'categories'
+        and fk['constrained_columns'] == ['category']
+        for fk in inspector.get_foreign_keys('questions')
+    )
+    has_index = any(
+        index['name'] == 'ix_questions_category'
+        for index in inspector.get_indexes('questions')
+    )
+
+    with op.batch_alter_table('questions') as batch_op:
+        if not has_foreign_key:
+            batch_op.create_foreign_key(
+                'fk_questions_category_categories', 'categories',
+                ['category'], ['id'],
+                onupdate='CASCADE', ondelete='SET NULL')
+        if not has_index:
+            batch_op.create_index('ix_questions_category', ['category'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    has_foreign_key = any(
+        fk['name'] == 'fk_questions_category_categories'
+        for fk in inspector.get_foreign_keys('questions')
+    )
+
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_index('ix_questions_category')
+        if has_foreign_key:
+            batch_op.drop_constraint('fk_questions_category_categories',
+                                     type_='foreignkey')
@@ -0,0 +1,39 @@
+"""quiz answers
+
+Revision ID: 3c1e6f0d9a47
+Revises: 8fba58dcd21e
+Create Date: 2026-10-18 19:05:12.480913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1e6f0d9a47'
+down_revision = '8fba58dcd21e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'quiz_answers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('player', sa.String(length=80), nullable=False),
+        sa.Column('category', sa.Integer(), nullable=True),
+        sa.Column('question', sa.Integer(), nullable=True),
+        sa.Column('correct', sa.Boolean(), nullable=False),
+        sa.Column('answered_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['category'], ['categories.id'],
+                                onupdate='CASCADE', ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_quiz_answers_category_player', 'quiz_answers',
+                    ['category', 'player'])
+
+
+def downgrade():
+    op.drop_index('ix_quiz_answers_category_player',
+                  table_name='quiz_answers')
+    op.drop_table('quiz_answers')
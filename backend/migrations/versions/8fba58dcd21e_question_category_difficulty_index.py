@@ -0,0 +1,39 @@
+"""question category and difficulty index
+
+Revision ID: 8fba58dcd21e
+Revises: f4bf665a5035
+Create Date: 2026-10-18 18:12:40.126503
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8fba58dcd21e'
+down_revision = 'f4bf665a5035'
+branch_labels = None
+depends_on = None
+
+
+def index_names():
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes('questions')}
+
+
+def upgrade():
+    # the composite index also serves lookups on category alone (the
+    # foreign key), so it replaces the single column index
+    names = index_names()
+    with op.batch_alter_table('questions') as batch_op:
+        if 'ix_questions_category_difficulty' not in names:
+            batch_op.create_index('ix_questions_category_difficulty',
+                                  ['category', 'difficulty'])
+        if 'ix_questions_category' in names:
+            batch_op.drop_index('ix_questions_category')
+
+
+def downgrade():
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.create_index('ix_questions_category', ['category'])
+        batch_op.drop_index('ix_questions_category_difficulty')
@@ -0,0 +1,40 @@
+"""question soft delete
+
+Revision ID: a5d2c8e17f30
+Revises: 3c1e6f0d9a47
+Create Date: 2026-10-18 20:41:07.552318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d2c8e17f30'
+down_revision = '3c1e6f0d9a47'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade():
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(),
+                                      nullable=True))
+
+    # partial indexes: live rows for the listings, tombstones for the
+    # purge job; neither grows with the other
+    op.create_index('ix_questions_live', 'questions', ['id'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_questions_deleted_at', 'questions', ['deleted_at'],
+                    postgresql_where=DELETED, sqlite_where=DELETED)
+
+
+def downgrade():
+    op.execute('DELETE FROM questions WHERE deleted_at IS NOT NULL')
+    op.drop_index('ix_questions_deleted_at', table_name='questions')
+    op.drop_index('ix_questions_live', table_name='questions')
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_column('deleted_at')
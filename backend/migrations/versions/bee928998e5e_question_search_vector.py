@@ -0,0 +1,39 @@
+"""question search vector
+
+Revision ID: bee928998e5e
+Revises:
+Create Date: 2026-10-18 09:12:44.318201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bee928998e5e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # full-text search is Postgres only, other backends use the in-memory
+    # inverted index in flaskr/search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute(
+        "ALTER TABLE questions ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS "
+        "(to_tsvector('english', coalesce(question, ''))) STORED"
+    )
+    op.create_index('ix_questions_search_vector', 'questions',
+                    ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_questions_search_vector', table_name='questions')
+    op.drop_column('questions', 'search_vector')
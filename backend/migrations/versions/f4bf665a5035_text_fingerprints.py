@@ -0,0 +1,76 @@
+"""question and category text fingerprints
+
+Revision ID: f4bf665a5035
+Revises: 0087b76c2f6f
+Create Date: 2026-10-18 11:26:05.904417
+
+"""
+import hashlib
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4bf665a5035'
+down_revision = '0087b76c2f6f'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+# frozen copy of models.fingerprint so later model changes can't alter
+# what this revision writes
+def fingerprint(text):
+    if text is None:
+        return None
+
+    normalized = " ".join(
+        unicodedata.normalize("NFKC", text).casefold().split()
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def backfill(table, text_column):
+    bind = op.get_bind()
+    rows = sa.table(table,
+                    sa.column('id', sa.Integer),
+                    sa.column(text_column, sa.String),
+                    sa.column('fingerprint', sa.String))
+
+    # the first row keeps the fingerprint, later duplicates stay NULL so
+    # the unique index can be built over existing data
+    seen = set()
+    updates = []
+    for row_id, text in bind.execute(
+            sa.select(rows.c.id, rows.c[text_column]).order_by(rows.c.id)):
+        value = fingerprint(text)
+        if value is None or value in seen:
+            continue
+        seen.add(value)
+        updates.append({'row_id': row_id, 'value': value})
+
+    statement = rows.update().where(
+        rows.c.id == sa.bindparam('row_id')
+    ).values(fingerprint=sa.bindparam('value'))
+    for start in range(0, len(updates), BATCH_SIZE):
+        bind.execute(statement, updates[start:start + BATCH_SIZE])
+
+
+def upgrade():
+    for table, text_column in (('questions', 'question'),
+                               ('categories', 'type')):
+        op.add_column(table, sa.Column('fingerprint', sa.String(length=64),
+                                       nullable=True))
+        backfill(table, text_column)
+        op.create_index(f'ix_{table}_fingerprint', table, ['fingerprint'],
+                        unique=True)
+
+
+def downgrade():
+    for table in ('questions', 'categories'):
+        op.drop_index(f'ix_{table}_fingerprint', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('fingerprint')
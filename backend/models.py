@@ -1,33 +1,210 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import hashlib
+from datetime import datetime
+import unicodedata
+from sqlalchemy import (
+    Boolean, Column, DateTime, String, Integer, ForeignKey, Index,
+    create_engine, event, update)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import relationship, sessionmaker, validates
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.expression import Select, UpdateBase
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 from marshmallow import Schema, fields, validate
 from flask_migrate import Migrate
 
 database_name = 'trivia'
-database_path = 'postgresql://{}:{}@{}/{}'.format(
+database_path = os.environ.get('DATABASE_URL',
+                               'postgresql://{}:{}@{}/{}'.format(
                                                 'postgres',
                                                 '12345678',
                                                 'localhost:5432',
-                                                database_name)
+                                                database_name))
+
+
+"""
+RoutingSession
+    sends the SELECTs of a request to the read replica picked for it by
+    flaskr.replicas (g.db_replica). Flushes and INSERT/UPDATE/DELETE
+    statements always go to the primary and mark the request as a
+    writer (g.db_wrote) for the read-your-writes window.
+"""
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if has_app_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True
+            elif isinstance(clause, Select) and "db_replica" in g:
+                return g.db_replica
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+# objects stay loaded after commit, so a freshly inserted row can be
+# returned without reading it back
+db = RoutingSQLAlchemy(session_options={"expire_on_commit": False})
+migrate = Migrate()
+
+POOL_DEFAULTS = {
+    "DB_POOL_SIZE": 5,
+    "DB_MAX_OVERFLOW": 10,
+    "DB_POOL_TIMEOUT": 30,
+    "DB_POOL_RECYCLE": 1800,
+    "DB_POOL_PRE_PING": True,
+    "DB_STATEMENT_TIMEOUT": 0,
+    "DB_PGBOUNCER": False,
+    "DB_CREATE_ALL": False
+}
+
+
+"""
+config_setting(config, name, default)
+    a setting from config, else from the environment, else `default`.
+    Strings (environment values) are coerced to the type of `default`;
+    "1", "true" and "yes" turn a boolean on.
+"""
+
+
+def config_setting(config, name, default=None):
+    value = config.get(name, os.environ.get(name, default))
+    if default is None or not isinstance(value, str):
+        return value
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+
+    return type(default)(value)
+
+
+def pool_setting(config, name):
+    return config_setting(config, name, POOL_DEFAULTS[name])
+
+
+"""
+engine_options(config, database_path)
+    SQLAlchemy engine options built from the DB_* settings in config or
+    the environment. DB_PGBOUNCER=1 hands pooling to PgBouncer (NullPool)
+    and applies the statement timeout per transaction so it works with
+    transaction pooling (psycopg2 never uses server-side prepared
+    statements, so nothing else has to be turned off).
+"""
+
+
+def engine_options(config, database_path):
+    url = make_url(database_path)
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    options = {"pool_pre_ping": pool_setting(config, "DB_POOL_PRE_PING")}
+
+    if pool_setting(config, "DB_PGBOUNCER"):
+        options["poolclass"] = NullPool
+    else:
+        options.update({
+            "pool_size": pool_setting(config, "DB_POOL_SIZE"),
+            "max_overflow": pool_setting(config, "DB_MAX_OVERFLOW"),
+            "pool_timeout": pool_setting(config, "DB_POOL_TIMEOUT"),
+            "pool_recycle": pool_setting(config, "DB_POOL_RECYCLE")
+        })
+        statement_timeout = pool_setting(config, "DB_STATEMENT_TIMEOUT")
+        if statement_timeout:
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={statement_timeout}"
+            }
+
+    return options
+
+
+"""
+local_statement_timeout(config)
+    the statement timeout to set per transaction: only behind PgBouncer,
+    where engine_options() can't pass it as a startup option. 0 = none.
+"""
+
+
+def local_statement_timeout(config):
+    if not pool_setting(config, "DB_PGBOUNCER"):
+        return 0
+
+    return pool_setting(config, "DB_STATEMENT_TIMEOUT")
+
+
+def set_local_statement_timeout(engine, statement_timeout):
+    if not statement_timeout or engine.dialect.name != "postgresql":
+        return
+
+    # PgBouncer rejects startup options and shares server sessions between
+    # clients, so the timeout is set per transaction instead
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        conn.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {statement_timeout}")
 
-db = SQLAlchemy()
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. No DDL runs here:
+    the schema is managed with `flask db upgrade`, and DB_CREATE_ALL=1 is
+    only meant for throwaway databases.
 """
 
 
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config,
+                                                             database_path)
     app.config['JSON_SORT_KEYS'] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
-    migrate = Migrate(app, db)
+    migrate.init_app(app, db)
+    statement_timeout = local_statement_timeout(app.config)
+    if statement_timeout:
+        set_local_statement_timeout(db.get_engine(app), statement_timeout)
+    if pool_setting(app.config, "DB_CREATE_ALL"):
+        with app.app_context():
+            db.create_all()
+
+
+"""
+bump_data_version()
+    moves the app's data version (see flaskr.cache.DataVersion) after a
+    committed write, which changes the ETag of every cached listing
+"""
+
+
+def bump_data_version():
+    data_version = current_app.extensions.get("trivia_data_version")
+    if data_version is not None:
+        data_version.bump()
+
+
+"""
+fingerprint(text)
+    hash of the casefolded, whitespace-collapsed text; backs the unique
+    indexes used to reject duplicate questions and categories
+"""
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def fingerprint(text):
+    if text is None:
+        return None
+
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
 
 
 """
@@ -35,6 +212,10 @@ Question
 
 """
 
+# the difficulty scale the quiz decks and adaptive play are built on
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+
 
 class QuestionSchema(Schema):
     question = fields.String(required=True,
@@ -48,7 +229,8 @@ class QuestionSchema(Schema):
                               validate=validate.Range(min=1))
     difficulty = fields.Integer(required=True,
                                 allow_none=False,
-                                validate=validate.Range(min=1))
+                                validate=validate.Range(min=MIN_DIFFICULTY,
+                                                        max=MAX_DIFFICULTY))
 
 
 class Question(db.Model):
@@ -57,10 +239,28 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(Integer)
+    category = Column(Integer,
+                      ForeignKey('categories.id',
+                                 onupdate='CASCADE',
+                                 ondelete='SET NULL'))
     difficulty = Column(Integer)
+    fingerprint = Column(String(64), index=True, unique=True)
+    # set on soft delete; the row stays until the purge job removes it
+    deleted_at = Column(DateTime)
     # rating = Column(Integer)
 
+    __table_args__ = (
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+        Index('ix_questions_live', 'id',
+              postgresql_where=deleted_at.is_(None),
+              sqlite_where=deleted_at.is_(None)),
+        Index('ix_questions_deleted_at', 'deleted_at',
+              postgresql_where=deleted_at.isnot(None),
+              sqlite_where=deleted_at.isnot(None)),
+    )
+
+    category_ref = relationship('Category', back_populates='questions')
+
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
@@ -68,16 +268,29 @@ class Question(db.Model):
         self.difficulty = difficulty
         # self.rating = rating
 
+    @validates('question')
+    def validate_question(self, key, question):
+        self.fingerprint = fingerprint(question)
+        return question
+
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        bump_data_version()
 
     def update(self):
         db.session.commit()
+        bump_data_version()
 
     def delete(self):
-        db.session.delete(self)
+        self.deleted_at = datetime.utcnow()
+        self.fingerprint = None
         db.session.commit()
+        bump_data_version()
+
+    @classmethod
+    def live(cls):
+        return cls.deleted_at.is_(None)
 
     def format(self):
         return {
@@ -89,6 +302,21 @@ class Question(db.Model):
             }
 
 
+"""
+soft_delete(ids, stamp)
+    UPDATE that turns the live questions among `ids` into tombstones.
+    The fingerprint is cleared so the same question can be added again
+    before the tombstone is purged.
+"""
+
+
+def soft_delete(ids, stamp):
+    return update(Question.__table__).where(
+        Question.id.in_(ids),
+        Question.live()
+        ).values(deleted_at=stamp, fingerprint=None)
+
+
 """
 Category
 
@@ -106,13 +334,24 @@ class Category(db.Model):
 
     id = Column(Integer, primary_key=True)
     type = Column(String)
+    fingerprint = Column(String(64), index=True, unique=True)
+
+    questions = relationship('Question',
+                             back_populates='category_ref',
+                             passive_deletes=True)
 
     def __init__(self, type):
         self.type = type
 
+    @validates('type')
+    def validate_type(self, key, type):
+        self.fingerprint = fingerprint(type)
+        return type
+
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        bump_data_version()
 
     # def format(self):
     #     return {
@@ -124,3 +363,40 @@ class Category(db.Model):
     #     return {
     #         self.id: self.type
     #         }
+
+
+"""
+QuizAnswer
+    one answered quiz question; written in batches by
+    flaskr.results.ResultRecorder, never one commit per answer
+"""
+
+
+class QuizAnswerSchema(Schema):
+    player = fields.String(required=True,
+                           allow_none=False,
+                           validate=validate.Length(min=1, max=80))
+    question = fields.Integer(required=True, allow_none=False)
+    correct = fields.Boolean(required=True, allow_none=False)
+    category = fields.Integer(load_default=None,
+                              validate=validate.Range(min=0))
+
+
+class QuizAnswer(db.Model):
+    __tablename__ = 'quiz_answers'
+
+    id = Column(Integer, primary_key=True)
+    player = Column(String(80), nullable=False)
+    category = Column(Integer,
+                      ForeignKey('categories.id',
+                                 onupdate='CASCADE',
+                                 ondelete='SET NULL'))
+    # no foreign key: answers outlive deleted questions and one stale id
+    # must not fail a whole batch
+    question = Column(Integer)
+    correct = Column(Boolean, nullable=False)
+    answered_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_quiz_answers_category_player', 'category', 'player'),
+    )
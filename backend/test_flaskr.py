@@ -1,38 +1,72 @@
+import asyncio
 import os
 from unicodedata import category
 import unittest
+from unittest import mock
+import gzip
 import json
-from flask_sqlalchemy import SQLAlchemy
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from starlette.testclient import TestClient
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.asgi import create_asgi_app
+from flaskr.quiz import QuizDecks
+from flaskr.tombstones import purge_questions
+from flaskr.traffic import SingleFlight
+from models import db, engine_options, Question, Category, QuizAnswer
+
+
+def flask_only(test):
+    """Marks a scenario the ASGI app doesn't serve (see create_asgi_app)."""
+    test.flask_only = True
+    return test
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
+        """Define test variables and initialize app.
+
+        The trivia_test database is expected to be loaded from trivia.psql
+        and migrated with `flask db upgrade`; no DDL runs per test.
+        """
         self.database_name = "trivia_test"
-        self.database_path = 'postgresql://{}:{}@{}/{}'.format(
-                                                            'postgres',
-                                                            '12345678',
-                                                            'localhost:5432',
-                                                            self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        self.database_path = os.environ.get(
+            'TEST_DATABASE_URL',
+            'postgresql://{}:{}@{}/{}'.format('postgres',
+                                              '12345678',
+                                              'localhost:5432',
+                                              self.database_name))
+        # one process takes every write here, so its ETags can be trusted
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                               "CONDITIONAL_GET": True})
+        self.client = self.app.test_client
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        # deleting through the API only leaves tombstones; purge them so
+        # every test leaves the questions as it found them
+        with self.app.app_context():
+            purge_questions(older_than=0)
+            db.session.remove()
+
+    def make_client(self, **config):
+        """A client of another app instance, like a second worker."""
+        return create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                           **config}).test_client()
+
+    def data_version(self):
+        return self.app.extensions['trivia_data_version']
+
+    def engine(self):
+        with self.app.app_context():
+            return db.engine
 
     def test_200_get_categories(self):
         res = self.client().get('/categories')
@@ -42,6 +76,153 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    def test_304_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+        # a content hash, valid in another worker without CONDITIONAL_GET
+        res = self.make_client().get('/categories',
+                                     headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    def count_statements(self, call):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.engine()
+        event.listen(engine, "before_cursor_execute", before_execute)
+        try:
+            return call(), len(statements)
+        finally:
+            event.remove(engine, "before_cursor_execute", before_execute)
+
+    def test_304_conditional_get_skips_database(self):
+        for path in ('/categories', '/questions?page=2',
+                     '/categories/1/questions'):
+            res = self.client().get(path)
+            etag = res.headers['ETag']
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('must-revalidate', res.headers['Cache-Control'])
+
+            res, statements = self.count_statements(
+                lambda: self.client().get(path,
+                                          headers={'If-None-Match': etag}))
+
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.headers['ETag'], etag)
+            self.assertEqual(statements, 0)
+
+    def test_etag_changes_with_data_version_and_query(self):
+        etag = self.client().get('/questions').headers['ETag']
+
+        self.assertNotEqual(
+            self.client().get('/questions?page=2').headers['ETag'], etag)
+
+        self.data_version().bump()
+        res = self.client().get('/questions',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_etag_is_not_valid_in_another_process(self):
+        etag = self.client().get('/questions?page=2').headers['ETag']
+
+        res = self.make_client(CONDITIONAL_GET=True).get(
+            '/questions?page=2', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+        # without a shared version backend listings carry no ETag
+        res = self.make_client().get('/questions?page=2')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res.headers)
+
+        with mock.patch.dict(os.environ, {"CONDITIONAL_GET": "true"}):
+            res = self.make_client().get('/questions?page=2')
+
+        self.assertIn('ETag', res.headers)
+
+    def test_200_get_questions_compact(self):
+        res = self.client().get('/questions')
+        version = json.loads(res.data)['categories_version']
+
+        res = self.client().get('/questions?fields=id,question&compact=1'
+                                f'&categories_version={version}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('success', data)
+        self.assertNotIn('categories', data)
+        self.assertTrue(len(data['questions']))
+        self.assertTrue(all(set(q) == {'id', 'question'}
+                            for q in data['questions']))
+
+    def test_400_if_unknown_field_selected(self):
+        res = self.client().get('/categories/1/questions?fields=id,secret')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    @flask_only
+    def test_200_get_questions_gzip(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "CONDITIONAL_GET": True,
+                          "COMPRESS_MIN_SIZE": 1})
+        client = app.test_client()
+
+        res = client.get('/questions', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data))
+        etag = res.headers['ETag']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertTrue(len(data['questions']))
+
+        res = client.get('/questions', headers={'Accept-Encoding': 'gzip',
+                                                'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    @flask_only
+    def test_json_provider_from_environment(self):
+        with mock.patch.dict(os.environ, {"JSON_PROVIDER": "stdlib"}):
+            app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+        self.assertNotEqual(type(app.json).__name__, 'OrjsonProvider')
+
+    @flask_only
+    def test_compression_settings_from_environment(self):
+        with mock.patch.dict(os.environ, {"COMPRESS_MIN_SIZE": "1"}):
+            res = self.make_client().get(
+                '/categories', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+
+        with mock.patch.dict(os.environ, {"COMPRESSION": "false",
+                                          "COMPRESS_MIN_SIZE": "1"}):
+            res = self.make_client().get(
+                '/categories', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', res.headers)
+
     def test_200_get_questions(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -61,19 +242,101 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 404)
         self.assertEqual(data['success'], False)
 
+    def test_200_get_questions_after_id(self):
+        res = self.client().get('/questions?after_id=20')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']))
+        self.assertTrue(all(q['id'] > 20 for q in data['questions']))
+
+    def test_404_sent_requesting_beyond_last_id(self):
+        res = self.client().get('/questions?after_id=99999')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_delete_question(self):
-        res = self.client().delete('/questions/21')
+        res = self.client().post('/questions', json={
+            "question": "Which question is deleted by this test?",
+            "answer": "This one", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+
+        res = self.client().delete(f'/questions/{created}')
         data = json.loads(res.data)
 
         question = Question.query.filter(
-                                        Question.id == 21
+                                        Question.id == created,
+                                        Question.live()
                                         ).one_or_none()
+        tombstone = db.session.get(Question, created)
 
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
-        self.assertEqual(data['deleted'], 21)
+        self.assertEqual(data['deleted'], created)
         self.assertEqual(question, None)
+        self.assertIsNotNone(tombstone.deleted_at)
+
+    def test_bulk_delete_and_purge_questions(self):
+        question = {"question": "Which job purges deleted questions?",
+                    "answer": "The purge job",
+                    "difficulty": 1,
+                    "category": 1}
+        created = [
+            json.loads(self.client().post("/questions", json={
+                **question, "question": f"{question['question']} {i}"
+                }).data)['created']
+            for i in range(2)
+            ]
+
+        res = self.client().delete(
+            f"/questions?ids={created[0]},{created[1]},99999")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], created)
+        self.assertEqual(data['not_found'], [99999])
+
+        # the tombstone released the text for a new question
+        res = self.client().post("/questions", json={
+            **question, "question": f"{question['question']} 0"})
+        recreated = json.loads(res.data)['created']
+
+        self.assertEqual(res.status_code, 200)
+
+        self.client().delete(f"/questions/{recreated}")
+        with self.app.app_context():
+            self.assertTrue(purge_questions(older_than=0) >= 3)
+            self.assertIsNone(db.session.get(Question, created[0]))
+
+    @flask_only
+    def test_purge_thread_starts_with_first_request(self):
+        def purge_threads():
+            return sum(thread.name == "question-purge"
+                       for thread in threading.enumerate())
+
+        running = purge_threads()
+        with mock.patch.dict(os.environ, {"QUESTION_PURGE_INTERVAL": "0"}):
+            self.make_client().get('/categories')
+
+        self.assertEqual(purge_threads(), running)
+
+        client = self.make_client()
+
+        self.assertEqual(purge_threads(), running)
+
+        client.get('/categories')
+
+        self.assertEqual(purge_threads(), running + 1)
+
+    def test_400_if_bulk_delete_ids_are_invalid(self):
+        res = self.client().delete("/questions?ids=1,two")
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['success'], False)
 
     def test_404_if_question_does_not_exist(self):
         res = self.client().delete("/question/99999")
@@ -93,6 +356,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["totalQuestions"])
         self.assertTrue(data["currentCategory"])
 
+    def test_200_get_question_search_by_word_prefix(self):
+        res = self.client().post("/questions",
+                                 json={"searchTerm": "LAKE afri"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["questions"]), 1)
+        self.assertEqual(data["questions"][0]["id"], 13)
+
     def test_200_get_question_search_without_results(self):
         res = self.client().post("/questions", json={"searchTerm": ".2.5!"})
         data = json.loads(res.data)
@@ -103,6 +376,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["totalQuestions"], 0)
         self.assertEqual(data["currentCategory"], "")
 
+    def test_200_get_question_search_follows_other_workers(self):
+        def create(text):
+            res = self.client().post("/questions", json={
+                "question": text, "answer": "Elsewhere",
+                "difficulty": 1, "category": 1})
+            return json.loads(res.data)["created"]
+
+        def search(client, term):
+            return json.loads(client.post(
+                "/questions", json={"searchTerm": term}).data)
+
+        with mock.patch.dict(os.environ, {"SEARCH_INDEX_REFRESH": "0.05"}):
+            client = self.make_client()
+        created = create("Which worker indexed the zeppelin?")
+
+        data = search(client, "zeppelin")
+
+        self.assertEqual([q["id"] for q in data["questions"]], [created])
+        self.assertEqual(data["totalQuestions"], 1)
+
+        # deleted by another worker before this index was refreshed
+        self.client().delete(f"/questions/{created}")
+        data = search(client, "zeppelin")
+
+        self.assertEqual(data["questions"], [])
+        self.assertEqual(data["totalQuestions"], 0)
+
+        created = create("Which worker indexed the dirigible?")
+        time.sleep(0.1)
+        data = search(client, "dirigible")
+
+        self.assertEqual([q["id"] for q in data["questions"]], [created])
+
+        self.client().delete(f"/questions/{created}")
+
     def test_200_create_new_question(self):
         question = {"question": "The best club",
                     "answer": "Real Madrid",
@@ -114,6 +422,35 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
+        self.assertTrue(data["created"])
+        self.assertEqual(data["question"]["id"], data["created"])
+
+        self.client().delete(f"/questions/{data['created']}")
+
+    def test_create_and_delete_question(self):
+        question = {"question": "Which server runs the async API?",
+                    "answer": "Uvicorn",
+                    "difficulty": 1,
+                    "category": 6}
+
+        res = self.client().post("/questions", json=question)
+        created = json.loads(res.data)["created"]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)["question"]["id"], created)
+
+        res = self.client().post("/questions", json=question)
+
+        self.assertEqual(res.status_code, 409)
+
+        res = self.client().delete(f"/questions/{created}")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)["deleted"], created)
+
+        res = self.client().delete(f"/questions/{created}")
+
+        self.assertEqual(res.status_code, 404)
 
     def test_400_if_question_bad_request(self):
         question = {"question": "The best club",
@@ -127,6 +464,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "bad request")
 
+    def test_400_if_question_difficulty_out_of_range(self):
+        res = self.client().post("/questions", json={
+            "question": "How hard can a question be?",
+            "answer": "Five", "difficulty": 6, "category": 1})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)["success"], False)
+
     def test_404_if_question_category_does_not_exist(self):
         question = {"question": "The best club",
                     "answer": "Real Madrid",
@@ -153,6 +498,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "resources conflict")
 
+    def test_409_if_question_differs_only_in_case_and_spacing(self):
+        question = {"question": "  what is the LARGEST   lake in Africa?",
+                    "answer": "Lake Victoria",
+                    "difficulty": 1,
+                    "category": 3}
+
+        res = self.client().post("/questions", json=question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(data["success"], False)
+
     def test_200_get_category_questions(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -160,9 +517,31 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['questions']))
-        self.assertEqual(data['totalQuestions'], 20)
+        self.assertEqual(data['totalQuestions'], Question.query.filter(
+            Question.category == 1, Question.live()).count())
+        self.assertEqual(data['totalQuestions'], len(data['questions']))
         self.assertEqual(data['currentCategory'], "Science")
 
+    @flask_only
+    def test_200_export_questions(self):
+        res = self.client().get('/questions/export?category=1')
+        rows = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(len(rows))
+        self.assertTrue(all(row['category'] == 1 for row in rows))
+
+    @flask_only
+    def test_200_export_questions_csv_gzip(self):
+        res = self.client().get('/questions/export?format=csv&gzip=true')
+        lines = gzip.decompress(res.data).decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(lines[0], 'id,question,answer,difficulty,category')
+        self.assertTrue(len(lines) > 1)
+
     def test_404_if_category_questions_does_not_exist(self):
         res = self.client().get("/categories/9999/questions")
         data = json.loads(res.data)
@@ -191,6 +570,22 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['question']))
 
+    def test_200_get_quizz_skips_previous_questions(self):
+        previous_questions = [20, 21]
+        category = {'type': 'Science', 'id': '1'}
+
+        for _ in range(5):
+            res = self.client().post(
+                                    "/quizzes",
+                                    json={
+                                        "previous_questions":
+                                            previous_questions,
+                                        "quiz_category": category})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['id'], 22)
+
     def test_200_get_quizz_withouth_questions(self):
         previous_questions = [20, 21, 22]
         category = {'type': 'Science', 'id': '1'}
@@ -206,6 +601,658 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['question'], "")
 
+    def test_200_get_quizz_with_session(self):
+        category = {'type': 'Science', 'id': '1'}
+
+        res = self.client().post("/quizzes/sessions",
+                                 json={"quiz_category": category})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['session'])
+
+        seen = set()
+        for _ in range(3):
+            res = self.client().post("/quizzes",
+                                     json={"session": data['session']})
+            question = json.loads(res.data)['question']
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn(question['id'], seen)
+            seen.add(question['id'])
+
+        res = self.client().post("/quizzes", json={"session": data['session']})
+
+        self.assertEqual(json.loads(res.data)['question'], "")
+
+    def test_200_get_quizz_by_difficulty(self):
+        category = {'type': 'Art', 'id': 2}
+
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [], "quiz_category": category,
+            "difficulty": 3})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 17)
+        self.assertEqual(data['difficulty'], 3)
+
+        # the bucket is used up, the nearest (easier first) is next
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [17], "quiz_category": category,
+            "difficulty": 3})
+
+        data = json.loads(res.data)
+
+        self.assertEqual(data['question']['id'], 19)
+        self.assertEqual(data['difficulty'], 2)
+        self.assertEqual(data['target_difficulty'], 3)
+
+    def test_400_if_quizz_difficulty_is_invalid(self):
+        for difficulty in ("abc", 99, 0):
+            res = self.client().post("/quizzes", json={
+                "previous_questions": [],
+                "quiz_category": {'type': 'Art', 'id': 2},
+                "difficulty": difficulty})
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_200_get_quizz_adaptive_session(self):
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {'type': 'Art', 'id': 2}, "adaptive": True})
+        token = json.loads(res.data)['session']
+
+        turns = [({"session": token}, 17),
+                 ({"session": token, "correct": True}, 18),
+                 ({"session": token, "correct": False}, 19)]
+        for body, question_id in turns:
+            res = self.client().post("/quizzes", json=body)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['id'], question_id)
+
+    def test_200_get_quizz_deals_questions_created_elsewhere(self):
+        with mock.patch.dict(os.environ, {"QUIZ_DECK_REFILL": "0",
+                                          "QUIZ_DECK_REFRESH": "0.05"}):
+            client = self.make_client()
+        body = {"previous_questions": [20, 21, 22],
+                "quiz_category": {'type': 'Science', 'id': '1'}}
+
+        res = client.post("/quizzes", json=body)
+
+        self.assertEqual(json.loads(res.data)['question'], "")
+
+        # another worker adds a question these decks never hear about
+        res = self.client().post('/questions', json={
+            "question": "Which worker created this question?",
+            "answer": "Another one", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+        time.sleep(0.1)
+
+        res = client.post("/quizzes", json=body)
+
+        self.assertEqual(json.loads(res.data)['question']['id'], created)
+
+        self.client().delete(f'/questions/{created}')
+
+    @flask_only
+    def test_200_get_quiz_stats(self):
+        # nothing is built (or queried) before the first quiz turn
+        time.sleep(0.05)
+        data = json.loads(self.client().get("/quizzes/stats").data)
+
+        self.assertEqual(data['rebuilds'], 0)
+        self.assertEqual(data['decks'], {})
+
+        self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {'type': 'Science', 'id': '1'}})
+
+        res = self.client().get("/quizzes/stats")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['background_refill'])
+        self.assertTrue(data['rebuilds'] >= 1)
+        self.assertTrue(data['decks']['1'])
+        self.assertTrue(data['decks']['all'] >= data['decks']['1'])
+        self.assertEqual(data['buckets']['2:3'], 1)
+        self.assertIsNotNone(data['rebuild_ms'])
+
+    @flask_only
+    def test_202_record_quiz_answers_and_leaderboard(self):
+        player = "leaderboard-tester"
+        for question_id, correct in ((16, True), (17, True), (18, False)):
+            res = self.client().post("/quizzes/answers", json={
+                "player": player, "question": question_id,
+                "correct": correct, "category": 2})
+
+            self.assertEqual(res.status_code, 202)
+
+        for path in ('/leaderboard?category=2', '/leaderboard'):
+            res = self.client().get(path)
+            leaders = {leader['player']: leader
+                       for leader in json.loads(res.data)['leaders']}
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(leaders[player]['score'], 2)
+            self.assertEqual(leaders[player]['answered'], 3)
+
+        with self.app.app_context():
+            self.app.extensions['trivia_results'].flush()
+            answers = QuizAnswer.query.filter(QuizAnswer.player == player)
+
+            self.assertEqual(answers.count(), 3)
+
+            answers.delete()
+            db.session.commit()
+
+    @flask_only
+    def test_400_if_quiz_answer_bad_request(self):
+        res = self.client().post("/quizzes/answers",
+                                 json={"question": 16, "correct": True})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    @flask_only
+    def test_results_settings_from_environment(self):
+        with mock.patch.dict(os.environ, {"LEADERBOARD_SIZE": "3",
+                                          "RESULTS_FLUSH_INTERVAL": "0.5"}):
+            app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+        recorder = app.extensions['trivia_results']
+
+        self.assertEqual(recorder.board_size, 3)
+        self.assertEqual(recorder.interval, 0.5)
+        self.assertEqual(
+            app.test_client().get('/leaderboard?limit=4').status_code, 400)
+
+    @flask_only
+    def test_404_if_leaderboard_category_does_not_exist(self):
+        res = self.client().get('/leaderboard?category=9999')
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_404_if_quiz_session_does_not_exist(self):
+        res = self.client().post("/quizzes", json={"session": "missing"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+
+    def test_200_get_quizz_from_another_worker_falls_back(self):
+        # the session was created by another worker, this one only has
+        # the previous questions the client sent along
+        res = self.client().post("/quizzes", json={
+            "session": "created-elsewhere", "correct": True,
+            "previous_questions": [20, 21],
+            "quiz_category": {'type': 'Science', 'id': '1'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 22)
+
+    @flask_only
+    def test_200_get_metrics_when_instrumented(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "INSTRUMENTATION": True})
+        client = app.test_client()
+
+        res = client.get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+        res = client.get('/metrics')
+        text = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_request_duration_seconds_count{method="GET",'
+                      'route="/questions",status="200"} 1', text)
+
+    @flask_only
+    def test_engine_options_from_config(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "DB_POOL_SIZE": "3",
+                          "DB_STATEMENT_TIMEOUT": 5000})
+
+        options = engine_options(app.config, 'postgresql://localhost/trivia')
+
+        self.assertEqual(options['pool_size'], 3)
+        self.assertEqual(options['pool_pre_ping'], True)
+        self.assertIn('statement_timeout=5000',
+                      options['connect_args']['options'])
+
+        app.config['DB_PGBOUNCER'] = 'true'
+        options = engine_options(app.config, 'postgresql://localhost/trivia')
+
+        self.assertEqual(options['poolclass'], NullPool)
+        self.assertNotIn('pool_size', options)
+
+    @flask_only
+    def test_statement_timeout_on_replicas_behind_pgbouncer(self):
+        if make_url(self.database_path).get_backend_name() != "postgresql":
+            self.skipTest("SET LOCAL statement_timeout needs Postgres")
+
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "DATABASE_REPLICA_URLS": self.database_path,
+                          "DB_PGBOUNCER": True,
+                          "DB_STATEMENT_TIMEOUT": 5000})
+        replica = app.extensions['trivia_replicas'].replicas[0]
+
+        with replica.engine.begin() as connection:
+            self.assertEqual(connection.exec_driver_sql(
+                "SHOW statement_timeout").scalar(), "5s")
+
+    def replica_database(self):
+        # a second SQLite file standing in for a lagging read replica
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        engine = create_engine(f"sqlite:///{path}")
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Category.__table__.insert(),
+                               {"id": 1, "type": "Replicas"})
+            connection.execute(Question.__table__.insert(), {
+                "id": 1, "question": "Which database answered this read?",
+                "answer": "The replica", "category": 1, "difficulty": 1})
+        engine.dispose()
+
+        return f"sqlite:///{path}"
+
+    @flask_only
+    def test_200_reads_from_replica_until_client_writes(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "DATABASE_REPLICA_URLS": self.replica_database()})
+        client = app.test_client()
+
+        res = client.get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'The replica')
+
+        res = client.post('/questions', json={
+            "question": "Which database takes the writes?",
+            "answer": "The primary", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+
+        self.assertIn('trivia_primary=1', res.headers['Set-Cookie'])
+
+        res = client.get('/questions')
+
+        self.assertTrue(json.loads(res.data)['total_questions'] > 1)
+        self.assertEqual(
+            app.extensions['trivia_replicas'].stats()['pinned_reads'], 1)
+
+        client.delete(f'/questions/{created}')
+
+    @flask_only
+    def test_replica_settings_from_environment(self):
+        with mock.patch.dict(os.environ, {
+                "DATABASE_REPLICA_URLS": self.replica_database(),
+                "REPLICA_READ_AFTER_WRITE": "0",
+                "REPLICA_HEALTH_INTERVAL": "0"}):
+            app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+        router = app.extensions['trivia_replicas']
+
+        self.assertEqual(len(router.replicas), 1)
+        self.assertEqual(router.window, 0)
+
+    @flask_only
+    def test_200_reads_fail_over_to_primary(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATABASE_REPLICA_URLS": "sqlite:////nonexistent/replica.db",
+            "REPLICA_HEALTH_INTERVAL": 0})
+        client = app.test_client()
+
+        for _ in range(2):
+            res = client.get('/questions')
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(json.loads(res.data)['total_questions'] > 1)
+
+        stats = app.extensions['trivia_replicas'].stats()
+
+        self.assertEqual(stats['failovers'], 1)
+        self.assertEqual(stats['primary_reads'], 1)
+        self.assertFalse(stats['replicas'][0]['healthy'])
+
+    @flask_only
+    def test_200_export_fails_over_to_primary(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATABASE_REPLICA_URLS": "sqlite:////nonexistent/replica.db",
+            "REPLICA_HEALTH_INTERVAL": 0})
+
+        res = app.test_client().get('/questions/export?category=1')
+        rows = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(rows))
+        self.assertEqual([row['id'] for row in rows],
+                         sorted(row['id'] for row in rows))
+        self.assertEqual(
+            app.extensions['trivia_replicas'].stats()['failovers'], 1)
+
+    @flask_only
+    def test_200_quizz_fails_over_to_primary(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATABASE_REPLICA_URLS": "sqlite:////nonexistent/replica.db",
+            "REPLICA_HEALTH_INTERVAL": 0})
+        client = app.test_client()
+
+        res = client.post("/quizzes", json={
+            "previous_questions": [20, 21],
+            "quiz_category": {'type': 'Science', 'id': '1'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 22)
+
+        stats = app.extensions['trivia_replicas'].stats()
+
+        self.assertEqual(stats['failovers'], 1)
+        self.assertFalse(stats['replicas'][0]['healthy'])
+
+    @flask_only
+    def test_200_quizz_deals_question_missing_on_replica(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path,
+                          "DATABASE_REPLICA_URLS": self.replica_database(),
+                          "REPLICA_READ_AFTER_WRITE": 0,
+                          "QUIZ_DECK_REFILL": False})
+        client = app.test_client()
+
+        res = client.post('/questions', json={
+            "question": "Which database has this question yet?",
+            "answer": "Only the primary", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+
+        for _ in range(2):
+            res = client.post("/quizzes", json={
+                "previous_questions": [20, 21, 22],
+                "quiz_category": {'type': 'Science', 'id': '1'}})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['id'], created)
+
+        client.delete(f'/questions/{created}')
+
+    @flask_only
+    def test_200_suggest_completions_follow_writes(self):
+        res = self.client().get('/questions/suggest?q=branch+of+hemat')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['suggestions'],
+                         [{"text": "branch of hematology", "count": 1}])
+
+        res = self.client().post('/questions', json={
+            "question": "Which hematologist suggested this question?",
+            "answer": "Nobody", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+        res = self.client().get('/questions/suggest?q=hematolog')
+
+        self.assertEqual(
+            [s['text'] for s in json.loads(res.data)['suggestions']],
+            ['hematologist', 'hematology'])
+
+        self.client().delete(f'/questions/{created}')
+        res = self.client().get('/questions/suggest?q=hematolog')
+
+        self.assertEqual(
+            [s['text'] for s in json.loads(res.data)['suggestions']],
+            ['hematology'])
+
+    @flask_only
+    def test_200_suggest_completions_follow_other_workers(self):
+        with mock.patch.dict(os.environ, {"SUGGEST_REFRESH": "0.05"}):
+            client = self.make_client()
+
+        def completions():
+            res = client.get('/questions/suggest?q=hemoglob')
+            return [s['text'] for s in json.loads(res.data)['suggestions']]
+
+        self.assertEqual(completions(), [])
+
+        # another worker adds and then deletes a question
+        res = self.client().post('/questions', json={
+            "question": "Which protein is hemoglobin made of?",
+            "answer": "Globin", "difficulty": 1, "category": 1})
+        created = json.loads(res.data)['created']
+        time.sleep(0.1)
+
+        self.assertEqual(completions(), ['hemoglobin'])
+
+        self.client().delete(f'/questions/{created}')
+        time.sleep(0.1)
+
+        self.assertEqual(completions(), [])
+
+    @flask_only
+    def test_200_suggest_categories(self):
+        res = self.client().get('/questions/suggest?q=geo')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'], [{"id": 3, "type": "Geography"}])
+
+    @flask_only
+    def test_400_if_suggest_limit_out_of_range(self):
+        res = self.client().get('/questions/suggest?q=geo&limit=500')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def limit_searches(self, client):
+        for _ in range(2):
+            res = client.post('/questions', json={"searchTerm": "title"})
+
+            self.assertEqual(res.status_code, 200)
+
+        res = client.post('/questions', json={"searchTerm": "title"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data['message'], 'too many requests')
+        self.assertTrue(int(res.headers['Retry-After']) > 0)
+
+        # another API key has its own bucket
+        res = client.post('/questions', json={"searchTerm": "title"},
+                          headers={"X-API-Key": "another-client"})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_429_if_search_rate_limited(self):
+        self.limit_searches(self.make_client(RATE_LIMIT_RATE=0.01,
+                                             RATE_LIMIT_BURST=2))
+
+    def test_rate_limit_settings_from_environment(self):
+        with mock.patch.dict(os.environ, {"RATE_LIMIT_RATE": "0.01",
+                                          "RATE_LIMIT_BURST": "2"}):
+            self.limit_searches(self.make_client())
+
+        with mock.patch.dict(os.environ, {"RATE_LIMIT": "0",
+                                          "RATE_LIMIT_BURST": "1"}):
+            client = self.make_client()
+            for _ in range(3):
+                res = client.post('/questions', json={"searchTerm": "title"})
+
+                self.assertEqual(res.status_code, 200)
+
+    @flask_only
+    def test_200_get_stats(self):
+        client = self.make_client(RATE_LIMIT_RATE=0.01, RATE_LIMIT_BURST=2)
+        self.limit_searches(client)
+        data = json.loads(client.get('/stats').data)
+
+        self.assertEqual(data['rate_limit']['allowed'], 3)
+        self.assertEqual(data['rate_limit']['limited'], 1)
+        self.assertEqual(data['rate_limit']['clients'], 2)
+        self.assertEqual(data['coalescing']['in_flight'], 0)
+
+    @flask_only
+    def test_quiz_decks_deal_levels_outside_the_scale(self):
+        decks = QuizDecks()
+        decks.build([(1, 1, 7), (2, 1, 2)])
+
+        self.assertEqual(decks.draw(1, {2}, difficulty=5), 1)
+        self.assertEqual(decks.draw(1, {1}, difficulty=5), 2)
+
+    @flask_only
+    def test_single_flight_shares_one_computation(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return b'{"questions": []}'
+
+        threads = [threading.Thread(
+            target=lambda: results.append(flights.do('/questions', compute)))
+            for _ in range(2)]
+        threads[0].start()
+        while flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        threads[1].start()
+        while flights.stats()['waiting'] == 0:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b'{"questions": []}'] * 2)
+        self.assertEqual(flights.stats()['shared'], 1)
+
+    @flask_only
+    def test_bulk_create_questions(self):
+        rows = [
+            {"question": "Bulk question one?", "answer": "One",
+             "difficulty": 1, "category": 6},
+            {"question": "What is the largest lake in Africa?",
+             "answer": "Lake Victoria", "difficulty": 2, "category": 3},
+            {"question": "Bulk question two?", "answer": "Two",
+             "difficulty": 1, "category": 9999},
+            {"question": "Bulk question three?", "answer": "Three",
+             "category": 1}
+        ]
+        payload = "\n".join(json.dumps(row) for row in rows)
+
+        res = self.client().post("/questions/bulk", data=payload,
+                                 content_type="application/x-ndjson")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["duplicates"], 1)
+        self.assertEqual([error["line"] for error in data["errors"]], [3, 4])
+
+        with self.app.app_context():
+            Question.query.filter(
+                Question.question == "Bulk question one?"
+                ).delete()
+            db.session.commit()
+
+
+class StarletteClient:
+    """Starlette's TestClient behind the Flask test client calls used above."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def request(self, method, path, json=None, data=None, headers=None,
+                content_type=None):
+        headers = dict(headers or {})
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        res = self._client.request(method, path, json=json, content=data,
+                                   headers=headers)
+        res.data = res.content
+        return res
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+class AsyncTriviaTestCase(TriviaTestCase):
+    """Every TriviaTestCase scenario against the asyncio (Starlette) app.
+
+    Scenarios for features only the Flask app serves are marked with
+    @flask_only and skipped here. The Flask app is still created, for
+    the tests that look at the database through the models. Every test
+    leaves the data as it found it, so it can run before or after
+    TriviaTestCase.
+    """
+
+    def setUp(self):
+        super().setUp()
+        if getattr(getattr(self, self._testMethodName), 'flask_only', False):
+            self.skipTest("not served by the ASGI app")
+
+        self.asgi_app = create_asgi_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path,
+             "CONDITIONAL_GET": True}
+            )
+        client = self.start_client(self.asgi_app)
+        self.client = lambda: client
+
+    def start_client(self, app):
+        client = TestClient(app)
+        client.__enter__()
+        self.addCleanup(client.__exit__, None, None, None)
+        return StarletteClient(client)
+
+    def make_client(self, **config):
+        return self.start_client(create_asgi_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path, **config}
+            ))
+
+    def data_version(self):
+        return self.asgi_app.state.data_version
+
+    def test_statement_timeout_behind_pgbouncer(self):
+        if make_url(self.database_path).get_backend_name() != "postgresql":
+            self.skipTest("SET LOCAL statement_timeout needs Postgres")
+
+        engine = create_asgi_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DB_PGBOUNCER": True,
+            "DB_STATEMENT_TIMEOUT": 5000}).state.engine
+
+        async def statement_timeout():
+            async with engine.begin() as connection:
+                result = await connection.exec_driver_sql(
+                    "SHOW statement_timeout")
+                return result.scalar()
+
+        self.assertEqual(asyncio.run(statement_timeout()), "5s")
+
+    def engine(self):
+        return self.asgi_app.state.engine.sync_engine
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
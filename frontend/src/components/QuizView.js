@@ -9,8 +9,10 @@ class QuizView extends Component {
     super();
     this.state = {
       quizCategory: null,
+      quizSession: null,
       previousQuestions: [],
       showAnswer: false,
+      lastCorrect: null,
       categories: {},
       numCorrect: 0,
       currentQuestion: {},
@@ -35,7 +37,28 @@ class QuizView extends Component {
   }
 
   selectCategory = ({ type, id = 0 }) => {
-    this.setState({ quizCategory: { type, id } }, this.getNextQuestion);
+    $.ajax({
+      url: '/quizzes/sessions',
+      type: 'POST',
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({ quiz_category: { type, id }, adaptive: true }),
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState(
+          { quizCategory: { type, id }, quizSession: result.session },
+          this.getNextQuestion
+        );
+        return;
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again');
+        return;
+      },
+    });
   };
 
   handleChange = (event) => {
@@ -53,9 +76,16 @@ class QuizView extends Component {
       type: 'POST',
       dataType: 'json',
       contentType: 'application/json',
+      // the previous result lets the server adapt the difficulty; the
+      // rest is for a worker that doesn't know the session
       data: JSON.stringify({
+        session: this.state.quizSession,
+        correct: this.state.lastCorrect,
         previous_questions: previousQuestions,
         quiz_category: this.state.quizCategory,
+        accuracy: previousQuestions.length
+          ? this.state.numCorrect / previousQuestions.length
+          : null,
       }),
       xhrFields: {
         withCredentials: true,
@@ -66,6 +96,7 @@ class QuizView extends Component {
           showAnswer: false,
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
+          lastCorrect: null,
           guess: '',
           forceEnd: result.question ? false : true,
         });
@@ -83,6 +114,7 @@ class QuizView extends Component {
     let evaluate = this.evaluateAnswer();
     this.setState({
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
+      lastCorrect: evaluate,
       showAnswer: true,
     });
   };
@@ -90,8 +122,10 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizSession: null,
       previousQuestions: [],
       showAnswer: false,
+      lastCorrect: null,
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
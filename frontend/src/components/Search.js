@@ -1,8 +1,10 @@
 import React, { Component } from 'react';
+import $ from 'jquery';
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   };
 
   getInfo = (event) => {
@@ -10,20 +12,49 @@ class Search extends Component {
     this.props.submitSearch(this.state.query);
   };
 
-  handleInputChange = () => {
-    this.setState({
-      query: this.search.value,
+  getSuggestions = (query) => {
+    if (query.trim() === '') {
+      this.setState({ suggestions: [] });
+      return;
+    }
+
+    $.ajax({
+      url: `/questions/suggest?q=${encodeURIComponent(query)}`,
+      type: 'GET',
+      success: (result) => {
+        // drop answers to keystrokes the user has already typed past
+        if (this.state.query === query) {
+          this.setState({ suggestions: result.suggestions });
+        }
+        return;
+      },
+      error: (error) => {
+        this.setState({ suggestions: [] });
+        return;
+      },
     });
   };
 
+  handleInputChange = () => {
+    const query = this.search.value;
+    this.setState({ query: query });
+    this.getSuggestions(query);
+  };
+
   render() {
     return (
       <form onSubmit={this.getInfo}>
         <input
           placeholder='Search questions...'
+          list='search-suggestions'
           ref={(input) => (this.search = input)}
           onChange={this.handleInputChange}
         />
+        <datalist id='search-suggestions'>
+          {this.state.suggestions.map((suggestion) => (
+            <option key={suggestion.text} value={suggestion.text} />
+          ))}
+        </datalist>
         <input type='submit' value='Submit' className='button' />
       </form>
     );